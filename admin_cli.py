@@ -0,0 +1,210 @@
+# admin_cli.py
+# Bulk administration without a Streamlit runtime. Reads the same .streamlit/secrets.toml.
+#   python admin_cli.py cancel-bookings --from 2025-06-01 --to 2025-06-07
+#   python admin_cli.py seed --users 200 --days 7 --bookings-per-day 10
+#   python admin_cli.py rebuild-caches
+#   python admin_cli.py prune-tombstones      # e.g. hourly from cron
+#   python admin_cli.py prune-sessions        # e.g. daily from cron
+#   python admin_cli.py reconcile-quotas      # e.g. nightly from cron
+#   python admin_cli.py snapshot-export --out snapshots/2025-06-01
+#   python admin_cli.py --config staging.toml snapshot-restore --from snapshots/2025-06-01
+import argparse
+import sys
+import time as timer
+from datetime import date, datetime, time, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from services import Database, ServiceError, load_config
+from services import bookings, users, schema, cache_epoch, occupancy, audit, quotas, snapshot, sessions
+from services.config import cache_epoch_path
+
+SEED_STUDENT_ID_PREFIX = "seed"
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"日期格式应为 YYYY-MM-DD: {value!r}")
+
+
+def _invalidate_app_caches(db):
+    """Tells running Streamlit processes to drop cached query results on their next rerun."""
+    cache_epoch.bump(cache_epoch_path(db.config))
+
+
+def cmd_init_db(db, args):
+    schema.init_schema(db)
+    print("数据库表已就绪。")
+
+
+def cmd_cancel_bookings(db, args):
+    if args.end_date < args.start_date:
+        raise SystemExit("--to 不能早于 --from。")
+    user_id = None
+    if args.student_id:
+        user = users.get_user_by_student_id(db, args.student_id)
+        if not user:
+            raise SystemExit(f"未找到学号 {args.student_id}。")
+        user_id = user["id"]
+    if not args.yes:
+        scope = f"学号 {args.student_id} 的" if args.student_id else "所有"
+        answer = input(f"将删除 {args.start_date} 至 {args.end_date} {scope}预约，确认? [y/N] ")
+        if answer.strip().lower() != "y":
+            print("已取消。")
+            return
+    deleted = bookings.cancel_bookings_in_range(db, args.start_date, args.end_date, user_id)
+    _invalidate_app_caches(db)
+    print(f"已删除 {deleted} 条预约。")
+
+
+def cmd_seed(db, args):
+    # One hash shared by every seeded account: hashing is the slow part and they are throwaway users
+    password_hash = generate_password_hash(args.password)
+    new_users = [
+        (f"{SEED_STUDENT_ID_PREFIX}{i:06d}", f"测试用户{i}", password_hash, "user")
+        for i in range(1, args.users + 1)
+    ]
+    inserted_users = users.add_users_bulk(db, new_users) if new_users else 0
+
+    seed_user_ids = [
+        row["id"] for row in db.fetch_all(
+            "SELECT id FROM users WHERE student_id LIKE %s ORDER BY id", (SEED_STUDENT_ID_PREFIX + "%",)
+        )
+    ]
+    new_bookings = []
+    if seed_user_ids and args.bookings_per_day:
+        # Back-to-back one-hour slots from 08:00 so seeded bookings never overlap each other
+        slots_per_day = min(args.bookings_per_day, 15)
+        for day_offset in range(args.days):
+            booking_date = args.start_date + timedelta(days=day_offset)
+            for slot in range(slots_per_day):
+                user_id = seed_user_ids[(day_offset * slots_per_day + slot) % len(seed_user_ids)]
+                new_bookings.append(
+                    (user_id, booking_date, time(8 + slot, 0), time(9 + slot, 0), 1, "seed")
+                )
+    inserted_bookings = bookings.add_bookings_bulk(db, new_bookings) if new_bookings else 0
+    _invalidate_app_caches(db)
+    print(f"已插入 {inserted_users} 个用户, {inserted_bookings} 条预约。")
+
+
+def cmd_prune_tombstones(db, args):
+    removed = bookings.prune_tombstones(db, datetime.now() - timedelta(hours=args.hours))
+    print(f"已清理 {removed} 条删除记录。")
+
+
+def cmd_prune_sessions(db, args):
+    removed = sessions.prune(db)
+    print(f"已清理 {removed} 个过期登录凭证。")
+
+
+def cmd_rebuild_caches(db, args):
+    days = occupancy.rebuild_all(db)
+    print(f"已重建 {days} 天的占用位图。")
+    counters = quotas.rebuild_all(db)
+    print(f"已重建 {counters} 条预约配额计数。")
+    _invalidate_app_caches(db)
+    print("已通知运行中的应用清除查询缓存。")
+
+
+def cmd_reconcile_quotas(db, args):
+    drifted = quotas.reconcile(db)
+    if drifted:
+        print(f"发现 {drifted} 条与预约表不一致的配额计数, 已重建。")
+    else:
+        print("配额计数与预约表一致。")
+
+
+def cmd_snapshot_export(db, args):
+    started = timer.perf_counter()
+    counts = snapshot.export_snapshot(db, args.out, args.format, args.chunk_size)
+    print(f"已导出 {counts['users']} 个用户, {counts['bookings']} 条预约到 {args.out} "
+          f"({timer.perf_counter() - started:.1f} 秒)。")
+
+
+def cmd_snapshot_restore(db, args):
+    if not args.yes:
+        answer = input(f"将把 {args.source} 导入当前数据库 (用户表和预约表须为空)，确认? [y/N] ")
+        if answer.strip().lower() != "y":
+            print("已取消。")
+            return
+    started = timer.perf_counter()
+    counts = snapshot.restore_snapshot(db, args.source, args.chunk_size)
+    _invalidate_app_caches(db)
+    print(f"已导入 {counts['users']} 个用户, {counts['bookings']} 条预约 "
+          f"({timer.perf_counter() - started:.1f} 秒, 含重建索引和派生表)。")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="会议室预约系统管理工具")
+    parser.add_argument("--config", help="secrets.toml 路径 (默认 .streamlit/secrets.toml 或 $RFA_SECRETS_FILE)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("init-db", help="创建缺失的数据表")
+    p.set_defaults(func=cmd_init_db)
+
+    p = subparsers.add_parser("cancel-bookings", help="删除日期范围内的预约 (单条 DELETE)")
+    p.add_argument("--from", dest="start_date", type=_parse_date, required=True)
+    p.add_argument("--to", dest="end_date", type=_parse_date, required=True)
+    p.add_argument("--student-id", help="只删除该学号的预约")
+    p.add_argument("--yes", "-y", action="store_true", help="不再确认")
+    p.set_defaults(func=cmd_cancel_bookings)
+
+    p = subparsers.add_parser("seed", help="批量插入测试用户和预约 (用于空的测试/压测库)")
+    p.add_argument("--users", type=int, default=50)
+    p.add_argument("--days", type=int, default=7)
+    p.add_argument("--bookings-per-day", type=int, default=8, help="每天预约数, 最多 15")
+    p.add_argument("--start-date", type=_parse_date, default=date.today())
+    p.add_argument("--password", default="000000", help="测试用户的初始密码")
+    p.set_defaults(func=cmd_seed)
+
+    p = subparsers.add_parser("prune-tombstones", help="清理实时预约看板用过的旧删除记录")
+    p.add_argument("--hours", type=int, default=int(bookings.TOMBSTONE_RETENTION.total_seconds() // 3600),
+                   help="保留最近多少小时的记录")
+    p.set_defaults(func=cmd_prune_tombstones)
+
+    p = subparsers.add_parser("prune-sessions", help="清理过期的登录凭证")
+    p.set_defaults(func=cmd_prune_sessions)
+
+    p = subparsers.add_parser("reconcile-quotas", help="核对预约配额计数, 不一致时重建")
+    p.set_defaults(func=cmd_reconcile_quotas)
+
+    p = subparsers.add_parser("snapshot-export", help="将用户和预约导出为 Parquet/Arrow 快照")
+    p.add_argument("--out", required=True, help="快照目录")
+    p.add_argument("--format", choices=list(snapshot.FORMATS), default="parquet")
+    p.add_argument("--chunk-size", type=int, default=snapshot.DEFAULT_CHUNK_SIZE)
+    p.set_defaults(func=cmd_snapshot_export)
+
+    p = subparsers.add_parser("snapshot-restore", help="将快照批量导入空数据库, 并重建索引和派生表")
+    p.add_argument("--from", dest="source", required=True, help="快照目录")
+    p.add_argument("--chunk-size", type=int, default=snapshot.DEFAULT_CHUNK_SIZE)
+    p.add_argument("--yes", "-y", action="store_true", help="不再确认")
+    p.set_defaults(func=cmd_snapshot_restore)
+
+    p = subparsers.add_parser("rebuild-caches", help="重建占用位图和配额计数, 并让运行中的应用丢弃缓存的查询结果")
+    p.set_defaults(func=cmd_rebuild_caches)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    db = None
+    try:
+        config = load_config(args.config)
+        db = Database(config)
+        db.audit_log = audit.create_audit_log(config, lambda: Database(config))
+        args.func(db, args)
+    except ServiceError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if db:
+            if db.audit_log:
+                db.audit_log.close() # Flush bulk-operation events before exiting
+            db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
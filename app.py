@@ -1,6 +1,9 @@
 # app.py
 import streamlit as st
-from database_utils import init_db, create_initial_admin_if_not_exists
+from database_utils import init_db, create_initial_admin_if_not_exists, sync_cache_epoch, take_waitlist_promotions_db
+from utils import convert_db_time_to_datetime_time
+from auth_utils import restore_session, write_session_cookie
+from profiling import run_page, show_profiler_sidebar
 
 # Import page functions directly
 from ui_pages.login import show_login_page
@@ -9,17 +12,22 @@ from ui_pages.booking import show_booking_page
 from ui_pages.manage_bookings import show_manage_bookings_page # Keep this import
 from ui_pages.user_management import show_user_management_page
 from ui_pages.change_password import show_change_password_page
+from ui_pages.audit_log import show_audit_log_page
 
 # --- App Setup ---
 st.set_page_config(page_title="会议室预约系统", layout="wide", initial_sidebar_state="expanded")
 init_db()
 create_initial_admin_if_not_exists("202330351561", "000000", "王祺浩")
+sync_cache_epoch()
 
 if "logged_in" not in st.session_state: st.session_state.logged_in = False
 if "force_password_change" not in st.session_state: st.session_state.force_password_change = False
 if "user_name" not in st.session_state: st.session_state.user_name = ""
 if "user_role" not in st.session_state: st.session_state.user_role = "user"
 
+restore_session() # Cookie login after a refresh/reconnect; logs out sessions whose token was revoked
+write_session_cookie()
+
 # --- Wrapper functions for pages with arguments ---
 def show_my_bookings_wrapper():
     show_manage_bookings_page(show_all=False)
@@ -37,6 +45,7 @@ change_password_pg_def = st.Page(show_change_password_page, title="修改密码"
 
 user_management_pg_def = st.Page(show_user_management_page, title="用户管理 (管理员)", icon="👥")
 all_bookings_pg_def = st.Page(show_all_bookings_wrapper, title="所有预约记录 (管理员)", icon="📋") # Use wrapper
+audit_log_pg_def = st.Page(show_audit_log_page, title="审计日志 (管理员)", icon="🧾")
 
 
 # --- Navigation Logic (remains the same) ---
@@ -47,6 +56,12 @@ else:
     st.sidebar.caption(f"角色: {'管理员' if st.session_state.user_role == 'admin' else '普通用户'}")
     st.sidebar.divider()
 
+    # Waitlisted requests booked by someone else's cancellation since this user's last page load
+    for promotion in take_waitlist_promotions_db(st.session_state.user_id):
+        start_str = convert_db_time_to_datetime_time(promotion['start_time']).strftime('%H:%M')
+        end_str = convert_db_time_to_datetime_time(promotion['end_time']).strftime('%H:%M')
+        st.success(f"候补成功：{promotion['booking_date']} {start_str} - {end_str} 已空出，系统已为您自动预约。")
+
     if st.session_state.force_password_change:
         st.warning("安全提示：您需要修改您的初始/临时密码后才能访问其他功能。")
         nav_structure = {
@@ -59,7 +74,7 @@ else:
         
         admin_tools_pages = []
         if st.session_state.user_role == 'admin':
-            admin_tools_pages = [user_management_pg_def, all_bookings_pg_def]
+            admin_tools_pages = [user_management_pg_def, all_bookings_pg_def, audit_log_pg_def]
 
         nav_config_dict = {
             "主要功能": main_app_pages,
@@ -70,4 +85,6 @@ else:
         
         pg = st.navigation(nav_config_dict)
 
-pg.run()
\ No newline at end of file
+run_page(pg) # pg.run(), profiled when an admin asked for it in this session
+if st.session_state.logged_in and st.session_state.user_role == 'admin':
+    show_profiler_sidebar()
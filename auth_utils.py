@@ -1,7 +1,14 @@
 # auth_utils.py
 import streamlit as st
+import streamlit.components.v1 as components
 from werkzeug.security import generate_password_hash, check_password_hash
-from database_utils import get_user_by_student_id_db
+from database_utils import (
+    get_user_by_student_id_db,
+    issue_session_token_db, validate_session_token_db, check_session_token_db, revoke_session_token_db,
+    warm_user_bookings
+)
+
+SESSION_COOKIE = "rfa_session"
 
 def hash_password(password):
     return generate_password_hash(password)
@@ -9,25 +16,93 @@ def hash_password(password):
 def verify_password(hashed_password, password):
     return check_password_hash(hashed_password, password)
 
+def _start_session(user):
+    st.session_state.logged_in = True
+    st.session_state.user_id = user['id']
+    st.session_state.student_id = user['student_id']
+    st.session_state.user_name = user['name']
+    st.session_state.user_role = user['role']
+    st.session_state.force_password_change = user['must_change_password_on_next_login']
+    warm_user_bookings(user['id'], user['role']) # In the background, while the first page renders
+
+def remember_session(user_id):
+    """Issues a session token for this login and queues the cookie holding it (see write_session_cookie)."""
+    issued = issue_session_token_db(user_id)
+    if issued is None:
+        return # Persistent sessions not configured
+    token, max_age = issued
+    st.session_state.session_token_id = token.split(".", 1)[0]
+    st.session_state.pending_session_cookie = (token, max_age)
+
 def login_user(student_id, password):
     user = get_user_by_student_id_db(student_id)
     if user and verify_password(user['password_hash'], password):
-        st.session_state.logged_in = True
-        st.session_state.user_id = user['id']
-        st.session_state.student_id = user['student_id']
-        st.session_state.user_name = user['name']
-        st.session_state.user_role = user['role']
-        st.session_state.force_password_change = user['must_change_password_on_next_login']
+        _start_session(user)
+        remember_session(user['id'])
         return True
     return False
 
-def logout_user():
+def _clear_session_state():
     keys_to_clear = [
         'logged_in', 'user_id', 'student_id', 'user_name', 
-        'user_role', 'force_password_change', 'page_after_password_change'
+        'user_role', 'force_password_change', 'page_after_password_change', 'session_token_id',
+        'profiler_remaining_runs', 'profiler_results' # The next user in this browser must not be profiled
     ]
     for key in keys_to_clear:
         if key in st.session_state:
             del st.session_state[key]
     st.session_state.logged_in = False # Explicitly set
-    st.rerun() # Force re-evaluation of navigation in app.py
\ No newline at end of file
+    st.session_state.pending_session_cookie = ("", 0) # Expire the cookie in the browser
+
+def restore_session():
+    """Called by app.py on every run, before navigation is built.
+
+    A logged-in session whose token was revoked (role change, password reset, logout
+    elsewhere) is logged out. A new browser session (refresh, reconnect) is logged in
+    from the cookie with an HMAC check and a cached lookup instead of the password hash.
+    """
+    if st.session_state.get("logged_in"):
+        token_id = st.session_state.get("session_token_id")
+        if token_id and check_session_token_db(token_id) is False: # None means the check itself failed
+            _clear_session_state()
+        return
+    # st.context.cookies is what the browser sent when this session connected; try it once
+    if st.session_state.get("session_restore_tried"):
+        return
+    token = st.context.cookies.get(SESSION_COOKIE)
+    if not token:
+        st.session_state.session_restore_tried = True
+        return
+    validated = validate_session_token_db(token)
+    if validated is None:
+        return # The database could not tell: keep the cookie and try again on the next run
+    st.session_state.session_restore_tried = True
+    if not validated:
+        st.session_state.pending_session_cookie = ("", 0) # Invalid, revoked or its user is gone
+        return
+    token_id, user = validated
+    _start_session(user)
+    st.session_state.session_token_id = token_id
+
+def write_session_cookie():
+    """Sets or clears the session cookie queued by login/logout. Done on the run after them,
+    because both end with st.rerun() and the component would never reach the browser."""
+    pending = st.session_state.pop("pending_session_cookie", None)
+    if pending is None:
+        return
+    token, max_age = pending # Token characters are [0-9a-zA-Z._-], safe inside the JS string
+    # Set from script, so it cannot be HttpOnly; Secure whenever the browser reached us over
+    # HTTPS (checked in the page, which also works behind a TLS-terminating proxy)
+    components.html(
+        f"<script>const secure = window.parent.location.protocol === 'https:' ? '; Secure' : '';"
+        f"window.parent.document.cookie = "
+        f"'{SESSION_COOKIE}={token}; path=/; max-age={max_age}; SameSite=Strict' + secure;</script>",
+        height=0,
+    )
+
+def logout_user():
+    token_id = st.session_state.get("session_token_id")
+    if token_id:
+        revoke_session_token_db(token_id)
+    _clear_session_state()
+    st.rerun() # Force re-evaluation of navigation in app.py
@@ -0,0 +1,87 @@
+# benchmarks/bench_conflict_check.py
+# Conflict check latency: occupancy bitmap lookup vs. the range-overlap JOIN scan.
+# Run against a scratch database (it inserts and then deletes its own bookings far in the future):
+#   python benchmarks/bench_conflict_check.py --config .streamlit/bench_secrets.toml --bookings-per-day 40
+import argparse
+import os
+import random
+import statistics
+import sys
+import time as timer
+from datetime import date, time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash
+
+from services import Database, load_config
+from services import bookings, users, schema, occupancy
+
+BENCH_DATE = date(2099, 1, 1) # Far from any real booking
+BENCH_STUDENT_ID = "bench-conflict"
+
+
+def _time_calls(fn, requests, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = timer.perf_counter()
+        for booking_date, start, end in requests:
+            fn(booking_date, start, end)
+        samples.append((timer.perf_counter() - started) / len(requests))
+    return statistics.median(samples) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Occupancy bitmap vs. interval query conflict checks")
+    parser.add_argument("--config")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--bookings-per-day", type=int, default=20, help="half-hour bookings per day, at most 48")
+    parser.add_argument("--checks", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    db = Database(load_config(args.config))
+    schema.init_schema(db)
+    users.add_users_bulk(db, [(BENCH_STUDENT_ID, "bench", generate_password_hash("bench"), "user")])
+    user_id = users.get_user_by_student_id(db, BENCH_STUDENT_ID)["id"]
+    last_date = BENCH_DATE + timedelta(days=args.days - 1)
+    bookings.cancel_bookings_in_range(db, BENCH_DATE, last_date)
+
+    per_day = min(args.bookings_per_day, 48)
+    rows = []
+    for d in range(args.days):
+        for slot in random.sample(range(48), per_day):
+            start = timedelta(minutes=30 * slot)
+            rows.append((user_id, BENCH_DATE + timedelta(days=d), start, start + timedelta(minutes=30), 1, "bench"))
+    bookings.add_bookings_bulk(db, rows)
+
+    requests = []
+    for _ in range(args.checks):
+        slot = random.randrange(47)
+        requests.append((
+            BENCH_DATE + timedelta(days=random.randrange(args.days)),
+            time(slot // 2, 30 * (slot % 2)),
+            time((slot + 1) // 2, 30 * ((slot + 1) % 2)),
+        ))
+    free_share = sum(
+        1 for d, s, e in requests if not bookings.find_conflicts_by_interval(db, d, s, e)
+    ) / len(requests)
+
+    try:
+        interval_us = _time_calls(lambda d, s, e: bookings.find_conflicts_by_interval(db, d, s, e), requests, args.repeat)
+        bitmap_us = _time_calls(lambda d, s, e: bookings.check_booking_conflict(db, d, s, e), requests, args.repeat)
+        lookup_us = _time_calls(
+            lambda d, s, e: occupancy.get_day_mask(db, d) & occupancy.slot_mask(s, e), requests, args.repeat
+        )
+    finally:
+        bookings.cancel_bookings_in_range(db, BENCH_DATE, last_date)
+        db.close()
+
+    print(f"{args.days} days x {per_day} bookings, {args.checks} checks ({free_share:.0%} free slots), median of {args.repeat}")
+    print(f"  interval JOIN scan     : {interval_us:8.1f} us/check")
+    print(f"  check_booking_conflict: {bitmap_us:8.1f} us/check  (bitmap, scan only on a hit)")
+    print(f"  bitmap lookup alone    : {lookup_us:8.1f} us/check")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/bench_prepared_statements.py
+# Per-call latency of the hot read queries: text protocol vs. prepared statements from
+# services/statements.py, each with the pure-Python connector and the C extension.
+# Read-only; point it at a database with some users and bookings (e.g. after `admin_cli.py seed`):
+#   python benchmarks/bench_prepared_statements.py --config .streamlit/bench_secrets.toml --calls 2000
+import argparse
+import os
+import statistics
+import sys
+import time as timer
+from datetime import date, datetime, time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+
+from services import load_config, statements
+
+
+def _connect(db_config, use_pure):
+    return mysql.connector.connect(
+        host=db_config["host"], port=db_config.get("port", 3306), user=db_config["user"],
+        password=db_config["password"], database=db_config["database_name"], autocommit=True, use_pure=use_pure,
+    )
+
+
+def _run_text(conn, name, params):
+    cursor = conn.cursor(dictionary=True) # What fetch_all does: new cursor, text SQL, every call
+    try:
+        cursor.execute(statements.STATEMENTS[name], params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def _time_calls(fn, conn, name, params, calls, repeat):
+    fn(conn, name, params) # Warm up (and prepare, for the prepared variant)
+    samples = []
+    for _ in range(repeat):
+        started = timer.perf_counter()
+        for _ in range(calls):
+            fn(conn, name, params)
+        samples.append((timer.perf_counter() - started) / calls)
+    return statistics.median(samples) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Text vs. prepared statements, pure Python vs. C extension")
+    parser.add_argument("--config")
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    db_config = load_config(args.config)["database"]
+    probe = _connect(db_config, use_pure=True)
+    cursor = probe.cursor(dictionary=True)
+    cursor.execute("SELECT id, student_id FROM users ORDER BY id LIMIT 1")
+    user = cursor.fetchone()
+    cursor.close()
+    probe.close()
+    if user is None:
+        raise SystemExit("No users in the database; run admin_cli.py seed first.")
+
+    today = date.today()
+    hot_queries = [
+        ("bookings_for_date", (today,)),
+        ("booking_changes", (today, datetime.now() - timedelta(seconds=10), today, datetime.now() - timedelta(seconds=10))),
+        ("bookings_from_date_for_user", (today, user["id"])),
+        ("conflicts", (today, time(9, 0), time(10, 0))),
+        ("day_mask", (today,)),
+        ("user_by_student_id", (user["student_id"],)),
+        ("user_profile", (user["id"],)),
+    ]
+    variants = [
+        ("text/pure", True, _run_text),
+        ("text/cext", False, _run_text),
+        ("prep/pure", True, statements.run),
+        ("prep/cext", False, statements.run),
+    ]
+    if not mysql.connector.HAVE_CEXT:
+        print("C extension not available; the cext columns use the pure-Python connector too.")
+
+    connections = {use_pure: _connect(db_config, use_pure) for use_pure in (True, False)}
+    try:
+        print(f"us/call, median of {args.repeat} x {args.calls} calls")
+        print(f"{'statement':30}" + "".join(f"{label:>12}" for label, _, _ in variants))
+        for name, params in hot_queries:
+            results = [
+                _time_calls(fn, connections[use_pure], name, params, args.calls, args.repeat)
+                for _, use_pure, fn in variants
+            ]
+            print(f"{name:30}" + "".join(f"{us:12.1f}" for us in results))
+    finally:
+        for conn in connections.values():
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,401 +1,502 @@
 # database_utils.py
+# Streamlit adapter over the `services` package: adds st.cache_* caching and reports
+# service errors with st.error, keeping the return conventions the pages rely on.
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+
 import streamlit as st
-import mysql.connector
-from mysql.connector import Error
-from werkzeug.security import generate_password_hash # For initial admin only
+from services import Database, ServiceError, DuplicateStudentIdError, BookingConflictError, QuotaExceededError, SlotAvailableError
+from services import bookings, users, schema, cache_epoch, audit, waitlist, reminders, sessions, warmup
+from services.config import cache_epoch_path
 
 # --- Connection (Cached Resource) ---
-@st.cache_resource(ttl=3600) # Cache the connection for 1 hour
-def get_db_connection():
-    # st.write("DEBUG: Attempting to create/retrieve DB connection...") # For debugging cache
+@st.cache_resource(ttl=3600) # Recreate the pools (and re-read secrets) every hour
+def get_database():
     try:
-        conn = mysql.connector.connect(
-            host=st.secrets["database"]["host"],
-            user=st.secrets["database"]["user"],
-            password=st.secrets["database"]["password"],
-            database=st.secrets["database"]["database_name"]
-        )
-        # st.write("DEBUG: DB Connection successful.") # For debugging
-        return conn
-    except Error as e:
-        st.error(f"数据库连接错误: {e}")
-        return None
-    except Exception as e: # Catch potential KeyError if secrets are not set
+        db = Database(st.secrets.to_dict())
+    except Exception as e: # Missing secrets file or [database] section
         st.error(f"读取数据库配置时出错: {e}. 请检查您的 Streamlit secrets 配置。")
         return None
+    db.audit_log = get_audit_log()
+    return db # init_db() attaches the reminder scheduler once the schema exists
+
+@st.cache_resource # One writer thread per process, kept across get_database() refreshes
+def get_audit_log():
+    config = st.secrets.to_dict()
+    return audit.create_audit_log(config, lambda: Database(config))
+
+@st.cache_resource # One scheduler thread per process; None unless [reminders] enabled = true
+def get_reminder_scheduler(): # Only called after schema init: the thread's first load reads reminder_deliveries
+    config = st.secrets.to_dict()
+    return reminders.create_reminder_scheduler(config, lambda: Database(config))
+
+def _quota_message(e):
+    if e.quota == "max_active_bookings":
+        return f"已达到预约上限：最多可同时持有 {e.limit} 个未结束的预约。"
+    return f"本周预约总时长将超过上限 {e.limit} 小时。"
+
+def _current_actor_id():
+    return st.session_state.get("user_id")
+
+_propagating = threading.local()
+
+@contextmanager
+def _propagate_service_errors():
+    """Within the block, cached wrappers that call _raise_if_propagating() re-raise a ServiceError
+    instead of reporting it and returning (and caching) their failure value: st.cache_data does
+    not cache exceptions. For callers that must tell a failed lookup from an empty result."""
+    previous = getattr(_propagating, "active", False)
+    _propagating.active = True
+    try:
+        yield
+    finally:
+        _propagating.active = previous
+
+def _raise_if_propagating():
+    if getattr(_propagating, "active", False):
+        raise # Re-raises the ServiceError being handled
+
+# --- Initialization (runs once per process) ---
+@st.cache_resource
+def _init_schema_once():
+    schema.init_schema(get_database()) # Raises on failure, so a failed attempt is retried next run
 
-# --- Initialization (Not cached, runs once or rarely) ---
 def init_db():
-    conn = get_db_connection() # Uses cached connection if available
-    if conn is None:
+    if get_database() is None:
         st.error("无法初始化数据库：数据库连接失败。")
         return
-    cursor = None # Initialize cursor to None
     try:
-        cursor = conn.cursor()
-        # Users Table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                student_id VARCHAR(20) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                name VARCHAR(100) NOT NULL,
-                role VARCHAR(10) NOT NULL DEFAULT 'user',
-                must_change_password_on_next_login BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        # Bookings Table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS bookings (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                user_id INT NOT NULL,
-                booking_date DATE NOT NULL,
-                start_time TIME NOT NULL,
-                end_time TIME NOT NULL,
-                attendees INT,
-                purpose TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """)
-        conn.commit()
-    except Error as e:
+        _init_schema_once()
+    except ServiceError as e:
         st.error(f"初始化数据库表时出错: {e}")
-    finally:
-        if cursor:
-            cursor.close()
-        # Do NOT close the connection `conn` here if it's from @st.cache_resource
+        return
+    get_database().reminders = get_reminder_scheduler() # Every run: get_database() is rebuilt hourly
 
 def create_initial_admin_if_not_exists(student_id, password, name):
-    conn = get_db_connection() # Uses cached connection
-    if conn is None: return
-    cursor = None
+    db = get_database()
+    if db is None: return
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM users WHERE student_id = %s AND role = 'admin'", (student_id,))
-        if cursor.fetchone() is None:
-            hashed_password = generate_password_hash(password)
-            cursor.execute(
-                "INSERT INTO users (student_id, password_hash, name, role) VALUES (%s, %s, %s, 'admin')",
-                (student_id, hashed_password, name)
-            )
-            conn.commit()
+        if users.ensure_initial_admin(db, student_id, password, name):
             st.success(f"初始管理员 '{name}' ({student_id}) 创建成功。")
-    except Error as e:
+    except ServiceError as e:
         st.error(f"创建初始管理员时出错: {e}")
-    finally:
-        if cursor:
-            cursor.close()
-        # Do NOT close conn
+
+_seen_cache_epoch = None
+
+def sync_cache_epoch():
+    """Drops cached query results if admin_cli.py (or another process) changed data since the last run."""
+    global _seen_cache_epoch
+    db = get_database()
+    if db is None: return
+    epoch = cache_epoch.current(cache_epoch_path(db.config))
+    if _seen_cache_epoch is not None and epoch != _seen_cache_epoch:
+        # The change was written by another process, so this one's read-your-writes window never
+        # opened: open it now, or the refill below could read (and cache) a replica that lags
+        db.mark_write()
+        st.cache_data.clear()
+        if db.reminders:
+            db.reminders.reload() # Bulk changes bypass the write paths that keep it in sync
+        warm_booking_window()
+    _seen_cache_epoch = epoch
 
 # --- User CRUD ---
 @st.cache_data(ttl=300) # Cache user data for 5 minutes
 def get_user_by_student_id_db(student_id):
-    # st.write(f"DEBUG: DB Fetch - get_user_by_student_id_db({student_id})")
-    conn = get_db_connection()
-    if not conn: return None
-    cursor = None
-    user = None
+    db = get_database()
+    if not db: return None
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM users WHERE student_id = %s", (student_id,))
-        user = cursor.fetchone()
-    except Error as e:
+        return users.get_user_by_student_id(db, student_id)
+    except ServiceError as e:
         st.error(f"DB: 获取用户(学号)失败: {e}")
-    finally:
-        if cursor: cursor.close()
-    return user
+        return None
 
 @st.cache_data(ttl=300)
 def get_user_by_id_db(user_id): # Primarily for fetching password_hash
-    # st.write(f"DEBUG: DB Fetch - get_user_by_id_db({user_id})")
-    conn = get_db_connection()
-    if not conn: return None
-    cursor = None
-    user_data = None
+    db = get_database()
+    if not db: return None
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT password_hash FROM users WHERE id = %s", (user_id,))
-        user_data = cursor.fetchone()
-    except Error as e:
+        return users.get_user_by_id(db, user_id)
+    except ServiceError as e:
         st.error(f"DB: 获取用户(ID)密码信息失败: {e}")
-    finally:
-        if cursor: cursor.close()
-    return user_data
+        return None
 
 def update_user_password_db(user_id, new_password_hash):
     # Clear relevant caches before modifying data
     get_user_by_id_db.clear() # User whose password changed
-    # Potentially clear other user-related caches if necessary
-    # get_user_by_student_id_db.clear() # If student_id is derived from user_id elsewhere
+    get_user_by_student_id_db.clear() # Login reads password_hash through this cache
+    _clear_user_list_caches() # must_change_password_on_next_login changed
+    is_session_token_active_db.clear() # The user's session tokens were revoked
 
-    conn = get_db_connection()
-    if not conn: return False
-    cursor = None
-    success = False
+    db = get_database()
+    if not db: return False
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET password_hash = %s, must_change_password_on_next_login = FALSE WHERE id = %s",
-            (new_password_hash, user_id)
-        )
-        conn.commit()
-        success = True
-    except Error as e:
+        users.update_user_password(db, user_id, new_password_hash, actor_id=_current_actor_id())
+        return True
+    except ServiceError as e:
         st.error(f"DB: 更新密码失败: {e}")
-    finally:
-        if cursor: cursor.close()
-    return success
+        return False
+
+@st.cache_data(ttl=60)
+def search_users_db(prefix, by, after=None):
+    db = get_database()
+    if not db: return [], None
+    try:
+        return users.search_users(db, prefix, by, after)
+    except ServiceError as e:
+        st.error(f"DB: 搜索用户失败: {e}")
+        return [], None
 
 @st.cache_data(ttl=300)
-def get_all_users_db():
-    # st.write("DEBUG: DB Fetch - get_all_users_db()")
-    conn = get_db_connection()
-    if not conn: return []
-    cursor = None
-    users = []
+def get_user_profile_db(user_id):
+    db = get_database()
+    if not db: return None
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id, student_id, name, role, must_change_password_on_next_login FROM users ORDER BY name")
-        users = cursor.fetchall()
-    except Error as e:
-        st.error(f"DB: 获取所有用户失败: {e}")
-    finally:
-        if cursor: cursor.close()
-    return users
+        return users.get_user_profile(db, user_id)
+    except ServiceError as e:
+        _raise_if_propagating()
+        st.error(f"DB: 获取用户信息失败: {e}")
+        return None
+
+def _clear_user_list_caches():
+    search_users_db.clear()
+    get_user_profile_db.clear()
 
 def add_user_db(student_id, name, password_hash, role):
-    get_all_users_db.clear()
-    # If get_user_by_student_id_db might be called immediately after for this new user:
-    # get_user_by_student_id_db.clear() # Or pass args to clear specific entry if API supports
-
-    conn = get_db_connection()
-    if not conn: return False
-    cursor = None
-    success = False
+    _clear_user_list_caches()
+    get_user_by_student_id_db.clear() # The page looked this student ID up (and cached None) just before
+
+    db = get_database()
+    if not db: return False
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO users (student_id, name, password_hash, role, must_change_password_on_next_login) VALUES (%s, %s, %s, %s, TRUE)",
-            (student_id, name, password_hash, role)
-        )
-        conn.commit()
-        success = True
-    except Error as e:
-        if e.errno == 1062:
-             st.error(f"学号 '{student_id}' 已被注册。")
-        else:
-            st.error(f"DB: 添加用户失败: {e}")
-    finally:
-        if cursor: cursor.close()
-    return success
+        users.add_user(db, student_id, name, password_hash, role, actor_id=_current_actor_id())
+        return True
+    except DuplicateStudentIdError:
+        st.error(f"学号 '{student_id}' 已被注册。")
+    except ServiceError as e:
+        st.error(f"DB: 添加用户失败: {e}")
+    return False
 
 def delete_user_db(user_id):
-    get_all_users_db.clear()
+    _clear_user_list_caches()
     get_user_by_id_db.clear()
-    # get_user_by_student_id_db.clear() # If it could have cached the deleted user
+    get_user_by_student_id_db.clear()
+    is_session_token_active_db.clear() # The user's session tokens go with it
 
-    conn = get_db_connection()
-    if not conn: return False
-    cursor = None
-    success = False
+    db = get_database()
+    if not db: return False
     try:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
-        conn.commit()
-        success = True
-    except Error as e:
+        users.delete_user(db, user_id, actor_id=_current_actor_id())
+        return True
+    except ServiceError as e:
         st.error(f"DB: 删除用户失败: {e}")
-    finally:
-        if cursor: cursor.close()
-    return success
+        return False
 
 def update_user_role_db(user_id, new_role):
-    get_all_users_db.clear() # Role change affects the list display
-    get_user_by_id_db.clear() # Potentially if role is part of user detail fetched by ID elsewhere
-    # get_user_by_student_id_db.clear()
-
-    conn = get_db_connection()
-    if not conn: return False
-    cursor = None
-    success = False
+    _clear_user_list_caches() # Role change affects the list display
+    get_user_by_id_db.clear()
+    get_user_by_student_id_db.clear() # Login reads the role from this cache
+    is_session_token_active_db.clear() # The user's session tokens were revoked
+
+    db = get_database()
+    if not db: return False
     try:
-        cursor = conn.cursor()
-        cursor.execute("UPDATE users SET role = %s WHERE id = %s", (new_role, user_id))
-        conn.commit()
-        success = True
-    except Error as e:
+        users.update_user_role(db, user_id, new_role, actor_id=_current_actor_id())
+        return True
+    except ServiceError as e:
         st.error(f"DB: 更新用户角色失败: {e}")
-    finally:
-        if cursor: cursor.close()
-    return success
+        return False
 
 def reset_user_password_db(user_id, new_password_hash):
     get_user_by_id_db.clear() # Password hash changed
-    get_all_users_db.clear() # must_change_password_on_next_login changed
+    get_user_by_student_id_db.clear()
+    _clear_user_list_caches() # must_change_password_on_next_login changed
+    is_session_token_active_db.clear() # The user's session tokens were revoked
 
-    conn = get_db_connection()
-    if not conn: return False
-    cursor = None
-    success = False
+    db = get_database()
+    if not db: return False
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET password_hash = %s, must_change_password_on_next_login = TRUE WHERE id = %s",
-            (new_password_hash, user_id)
-        )
-        conn.commit()
-        success = True
-    except Error as e:
+        users.reset_user_password(db, user_id, new_password_hash, actor_id=_current_actor_id())
+        return True
+    except ServiceError as e:
         st.error(f"DB: 重置密码失败: {e}")
-    finally:
-        if cursor: cursor.close()
-    return success
+        return False
+
+# --- Session tokens ---
+def issue_session_token_db(user_id):
+    """(token, max_age_seconds) for the login cookie, or None if persistent sessions are off."""
+    db = get_database()
+    if not db: return None
+    settings = sessions.session_settings(db.config)
+    if not settings: return None
+    secret, ttl_seconds = settings
+    try:
+        return sessions.issue(db, secret, user_id, ttl_seconds), ttl_seconds
+    except ServiceError as e:
+        st.error(f"DB: 创建登录凭证失败: {e}")
+        return None
+
+@st.cache_data(ttl=30) # Revocations from this process clear it; other processes see them within 30 s
+def is_session_token_active_db(token_id):
+    db = get_database()
+    if not db: return None
+    try:
+        return sessions.is_active(db, token_id)
+    except ServiceError as e:
+        _raise_if_propagating()
+        st.error(f"DB: 校验登录凭证失败: {e}")
+        return None
+
+def check_session_token_db(token_id):
+    """True if the token is still active, False if revoked or expired, None if the check failed
+    (the failure is not cached, so the next run checks again)."""
+    try:
+        with _propagate_service_errors():
+            return is_session_token_active_db(token_id)
+    except ServiceError as e:
+        st.error(f"DB: 校验登录凭证失败: {e}")
+        return None
+
+def validate_session_token_db(token):
+    """(token_id, user profile) for a valid, unrevoked token of an existing user; False if the
+    token is invalid, revoked or its user is gone; None if the database could not tell (nothing
+    is cached then). HMAC check first, so forged or expired cookies never reach the database."""
+    db = get_database()
+    if not db: return None
+    settings = sessions.session_settings(db.config)
+    if not settings: return False
+    parsed = sessions.parse(settings[0], token)
+    if not parsed: return False
+    token_id, user_id, _ = parsed
+    try:
+        with _propagate_service_errors():
+            if not is_session_token_active_db(token_id):
+                return False
+            user = get_user_profile_db(user_id)
+    except ServiceError as e:
+        st.error(f"DB: 校验登录凭证失败: {e}")
+        return None
+    return (token_id, user) if user else False
+
+def revoke_session_token_db(token_id):
+    is_session_token_active_db.clear()
+    db = get_database()
+    if not db: return
+    try:
+        sessions.revoke(db, token_id)
+    except ServiceError as e:
+        st.error(f"DB: 注销登录凭证失败: {e}")
 
 # --- Booking CRUD ---
-@st.cache_data(ttl=60) # Cache booking data for 1 minute
+@st.cache_data(ttl=60, show_spinner=False) # Cache booking data for 1 minute; no spinner, also warmed off-thread
 def get_bookings_for_date_db(booking_date):
-    # st.write(f"DEBUG: DB Fetch - get_bookings_for_date_db({booking_date})")
-    conn = get_db_connection()
-    if not conn: return []
-    cursor = None
-    bookings = []
+    db = get_database()
+    if not db: return []
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT b.start_time, b.end_time, u.name as user_name, u.student_id, b.attendees, b.purpose
-            FROM bookings b JOIN users u ON b.user_id = u.id
-            WHERE b.booking_date = %s ORDER BY b.start_time
-        """, (booking_date,))
-        bookings = cursor.fetchall()
-    except Error as e:
+        return bookings.get_bookings_for_date(db, booking_date)
+    except ServiceError as e:
+        _raise_if_propagating()
         st.error(f"DB: 获取当日预约失败: {e}")
-    finally:
-        if cursor: cursor.close()
-    return bookings
+        return []
 
-@st.cache_data(ttl=60)
+# Not cached: each open board polls with its own watermark, and the query is a small index range scan
+def get_booking_changes_db(booking_date, since):
+    db = get_database()
+    if not db: return []
+    try:
+        return bookings.get_booking_changes(db, booking_date, since)
+    except ServiceError as e:
+        st.error(f"DB: 获取预约变更失败: {e}")
+        return []
+
+@st.cache_data(ttl=60, show_spinner=False)
 def get_bookings_filtered_db(display_start_date, user_id_to_filter=None):
-    # st.write(f"DEBUG: DB Fetch - get_bookings_filtered_db(start={display_start_date}, user={user_id_to_filter})")
-    conn = get_db_connection()
-    if not conn: return []
-    cursor = None
-    bookings = []
-    query = """
-        SELECT b.id, b.booking_date, b.start_time, b.end_time, u.name as user_name, u.student_id, b.attendees, b.purpose
-        FROM bookings b JOIN users u ON b.user_id = u.id
-        WHERE b.booking_date >= %s
-    """
-    params = [display_start_date]
-
-    if user_id_to_filter:
-        query += " AND b.user_id = %s"
-        params.append(user_id_to_filter)
-    query += " ORDER BY b.booking_date DESC, b.start_time ASC"
-    
+    db = get_database()
+    if not db: return []
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(query, tuple(params))
-        bookings = cursor.fetchall()
-    except Error as e:
+        return bookings.get_bookings_filtered(db, display_start_date, user_id_to_filter)
+    except ServiceError as e:
+        _raise_if_propagating()
         st.error(f"DB: 获取预约列表失败: {e}")
-    finally:
-        if cursor: cursor.close()
-    return bookings
+        return []
 
 def create_booking_db(user_id, booking_date, start_time, end_time, attendees, purpose):
     # Clear caches that would be affected
     get_bookings_for_date_db.clear() # Could clear with args if API supports: (booking_date,)
     get_bookings_filtered_db.clear()
 
-    conn = get_db_connection()
-    if not conn: return False
-    cursor = None
-    success = False
+    db = get_database()
+    if not db: return False
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO bookings (user_id, booking_date, start_time, end_time, attendees, purpose) VALUES (%s, %s, %s, %s, %s, %s)",
-            (user_id, booking_date, start_time, end_time, attendees, purpose)
-        )
-        conn.commit()
-        success = True
-    except Error as e:
+        bookings.create_booking(db, user_id, booking_date, start_time, end_time, attendees, purpose, actor_id=_current_actor_id())
+        refresh_booking_caches(booking_date)
+        return True
+    except BookingConflictError:
+        st.error("该时间段刚刚被其他人预约，请重新选择。")
+        return False
+    except QuotaExceededError as e:
+        st.error(_quota_message(e))
+        return False
+    except ServiceError as e:
         st.error(f"DB: 创建预约失败: {e}")
-    finally:
-        if cursor: cursor.close()
-    return success
+        return False
 
 def delete_booking_db(booking_id):
     get_bookings_for_date_db.clear() # Could be more specific if we knew the date
     get_bookings_filtered_db.clear()
 
-    conn = get_db_connection()
-    if not conn: return False
-    cursor = None
-    success = False
+    db = get_database()
+    if not db: return False
     try:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM bookings WHERE id = %s", (booking_id,))
-        conn.commit()
-        success = True
-    except Error as e:
+        bookings.delete_booking(db, booking_id, actor_id=_current_actor_id())
+        refresh_booking_caches()
+        return True
+    except ServiceError as e:
         st.error(f"DB: 删除预约失败: {e}")
-    finally:
-        if cursor: cursor.close()
-    return success
+        return False
 
 def update_booking_db(booking_id, booking_date, start_time, end_time, attendees, purpose):
     get_bookings_for_date_db.clear() # Could be more specific
     get_bookings_filtered_db.clear()
 
-    conn = get_db_connection()
-    if not conn: return False
-    cursor = None
-    success = False
+    db = get_database()
+    if not db: return False
     try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE bookings SET booking_date=%s, start_time=%s, end_time=%s, attendees=%s, purpose=%s
-            WHERE id=%s
-        """, (booking_date, start_time, end_time, attendees, purpose, booking_id))
-        conn.commit()
-        success = True
-    except Error as e:
+        bookings.update_booking(db, booking_id, booking_date, start_time, end_time, attendees, purpose, actor_id=_current_actor_id())
+        refresh_booking_caches(booking_date)
+        return True
+    except BookingConflictError:
+        st.error("该时间段刚刚被其他人预约，请重新选择。")
+        return False
+    except QuotaExceededError as e:
+        st.error(_quota_message(e))
+        return False
+    except ServiceError as e:
         st.error(f"DB: 更新预约失败: {e}")
-    finally:
-        if cursor: cursor.close()
-    return success
+        return False
 
 # Not caching this function to always get the latest conflict status before a write
 def check_booking_conflict_db(booking_date, start_time, end_time, exclude_booking_id=None):
-    # st.write(f"DEBUG: DB Check - check_booking_conflict_db({booking_date}, {start_time}, {end_time})")
-    conn = get_db_connection()
-    if not conn: return True # Assume conflict on DB error
-    cursor = None
-    conflicts = []
-    query = """
-        SELECT b.id, u.name as user_name, u.student_id, b.start_time, b.end_time, b.purpose
-        FROM bookings b JOIN users u ON b.user_id = u.id
-        WHERE b.booking_date = %s AND (
-            (%s < b.end_time AND %s > b.start_time) 
-        )
-    """ 
-    params = [booking_date, start_time, end_time]
-
-    if exclude_booking_id:
-        query += " AND b.id != %s"
-        params.append(exclude_booking_id)
-    
+    db = get_database()
+    if not db: return True # Assume conflict on DB error
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(query, tuple(params))
-        conflicts = cursor.fetchall()
-    except Error as e:
+        return bookings.check_booking_conflict(db, booking_date, start_time, end_time, exclude_booking_id)
+    except ServiceError as e:
         st.error(f"DB: 检查冲突失败: {e}")
         return True # Assume conflict on DB error
-    finally:
-        if cursor: cursor.close()
-    return conflicts
\ No newline at end of file
+
+# --- Waitlist ---
+def join_waitlist_db(user_id, booking_date, start_time, end_time, attendees, purpose):
+    db = get_database()
+    if not db: return False
+    try:
+        waitlist.join(db, user_id, booking_date, start_time, end_time, attendees, purpose)
+        return True
+    except SlotAvailableError:
+        get_bookings_for_date_db.clear(booking_date) # The board still shows the cancelled booking
+        st.warning("该时段已空出，请直接提交预约。")
+        return False
+    except ServiceError as e:
+        st.error(f"DB: 加入候补失败: {e}")
+        return False
+
+def leave_waitlist_db(entry_id, user_id):
+    db = get_database()
+    if not db: return False
+    try:
+        return waitlist.leave(db, entry_id, user_id)
+    except ServiceError as e:
+        st.error(f"DB: 取消候补失败: {e}")
+        return False
+
+# Not cached: small indexed reads, and promotions must show up on the very next page load
+def get_waiting_entries_db(user_id, now):
+    db = get_database()
+    if not db: return []
+    try:
+        return waitlist.get_waiting_entries(db, user_id, now)
+    except ServiceError as e:
+        st.error(f"DB: 获取候补列表失败: {e}")
+        return []
+
+def take_waitlist_promotions_db(user_id):
+    """Promotions not yet shown to the user, marked as shown."""
+    db = get_database()
+    if not db: return []
+    try:
+        promotions = waitlist.pending_promotions(db, user_id)
+        waitlist.acknowledge_promotions(db, user_id, [p["id"] for p in promotions])
+    except ServiceError as e:
+        st.error(f"DB: 获取候补结果失败: {e}")
+        return []
+    if promotions:
+        get_bookings_filtered_db.clear() # Another process made these bookings; drop this one's stale lists
+        get_bookings_for_date_db.clear()
+        refresh_booking_caches(*{p["booking_date"] for p in promotions})
+    return promotions
+
+# --- Audit Log ---
+def query_audit_events_db(start, end, action=None, actor_student_id=None):
+    db = get_database()
+    if not db: return []
+    try:
+        return audit.query_events(db, start, end, action, actor_student_id)
+    except ServiceError as e:
+        st.error(f"DB: 查询审计日志失败: {e}")
+        return []
+
+# --- Background cache warming ---
+# The booking pages open on today's board, the next few days and "my bookings" from today.
+# These loads run on the warmer's worker threads and fill the same st.cache_data entries the
+# pages read, so they must be called with the same positional arguments as the pages use.
+# Worker threads have no session: anything from st.session_state is captured by the caller.
+# A failed load raises instead of caching [] (see _propagate_service_errors), so no session
+# is shown an empty list without the error; the warmer logs it.
+WARM_WINDOW_DAYS = 7
+
+def _warm(cached_fn, args, refresh):
+    if get_database() is None:
+        return # The wrappers would cache [] for it
+    with _propagate_service_errors():
+        if refresh:
+            cached_fn.clear(*args) # A page may have cached rows read before the write committed
+        cached_fn(*args)
+
+@st.cache_resource # One pool per process
+def get_cache_warmer():
+    warmer = warmup.CacheWarmer()
+    warmer.start_daily(warm_booking_window) # The window moves at midnight
+    return warmer
+
+def _submit_loads(loads, refresh):
+    warmer = get_cache_warmer()
+    for cached_fn, args in loads:
+        key = (("refresh",) if refresh else ()) + (cached_fn.__name__,) + args
+        warmer.submit(key, _warm, cached_fn, args, refresh)
+
+def _window_loads(extra_dates=()):
+    today = date.today()
+    days = {today + timedelta(days=offset) for offset in range(WARM_WINDOW_DAYS)} | set(extra_dates)
+    return [(get_bookings_for_date_db, (day,)) for day in sorted(days)]
+
+def warm_booking_window():
+    """Loads the next WARM_WINDOW_DAYS day boards into the cache in the background."""
+    _submit_loads(_window_loads(), refresh=False)
+
+def warm_user_bookings(user_id, role):
+    """At login: the user's booking list (all bookings for admins) and the day boards."""
+    today = date.today()
+    loads = [(get_bookings_filtered_db, (today, user_id))]
+    if role == 'admin':
+        loads.append((get_bookings_filtered_db, (today, None)))
+    _submit_loads(loads + _window_loads(), refresh=False)
+
+def refresh_booking_caches(*booking_dates):
+    """After a booking write: reload the affected day boards, the window and the lists from today."""
+    today = date.today()
+    loads = _window_loads(day for day in booking_dates if day >= today)
+    loads.append((get_bookings_filtered_db, (today, None)))
+    user_id = _current_actor_id()
+    if user_id is not None:
+        loads.append((get_bookings_filtered_db, (today, user_id)))
+    _submit_loads(loads, refresh=True)
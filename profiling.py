@@ -0,0 +1,93 @@
+# profiling.py
+# Admin-only, per-session profiler: cProfile around the next N page runs (pg.run() in app.py).
+# Each profiled run is saved as a .prof file for offline analysis (snakeviz, pstats) and its
+# top functions are listed in the sidebar. When no runs are requested, run_page() costs one
+# session_state lookup. Fragment reruns (e.g. the live day board) are not full page runs
+# and are only included when they happen inside a profiled run. Only the newest
+# KEPT_FILES .prof files are kept on disk.
+import cProfile
+import os
+import pstats
+import time
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+DEFAULT_PROFILE_DIR = "profiles"
+TOP_FUNCTIONS = 25
+KEPT_RESULTS = 5
+KEPT_FILES = 50 # Across all sessions
+
+def _profile_dir():
+    return st.secrets.get("app", {}).get("profile_dir", DEFAULT_PROFILE_DIR)
+
+def _top_functions(profiler):
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, func), (_, calls, own_time, cumulative_time, _) in stats.stats.items():
+        location = f"{os.path.basename(filename)}:{line}" if line else filename # line 0: built-ins
+        rows.append({
+            "函数": f"{func} ({location})", "调用次数": calls,
+            "自身耗时(ms)": round(own_time * 1000, 2), "累计耗时(ms)": round(cumulative_time * 1000, 2),
+        })
+    rows.sort(key=lambda r: r["累计耗时(ms)"], reverse=True)
+    return rows[:TOP_FUNCTIONS]
+
+def _record(profiler, page_title, elapsed):
+    profile_dir = _profile_dir()
+    os.makedirs(profile_dir, exist_ok=True)
+    started_at = datetime.now()
+    path = os.path.join(profile_dir, f"{started_at:%Y%m%d-%H%M%S-%f}-{st.session_state.get('student_id', 'anon')}.prof")
+    profiler.dump_stats(path)
+    results = st.session_state.setdefault("profiler_results", [])
+    results.insert(0, {
+        "at": started_at, "page": page_title, "elapsed": elapsed, "path": path, "top": _top_functions(profiler),
+    })
+    del results[KEPT_RESULTS:]
+    _prune(profile_dir)
+
+def _prune(profile_dir):
+    # File names start with the timestamp, so name order is age order
+    files = sorted(name for name in os.listdir(profile_dir) if name.endswith(".prof"))
+    for name in files[:-KEPT_FILES]:
+        try:
+            os.remove(os.path.join(profile_dir, name))
+        except FileNotFoundError:
+            pass # Pruned by another session at the same time
+
+def run_page(pg):
+    """pg.run(), under cProfile if this session asked for profiled runs."""
+    remaining = st.session_state.get("profiler_remaining_runs")
+    if not remaining or st.session_state.get("user_role") != 'admin': # Logged out or lost the role since
+        pg.run()
+        return
+    st.session_state.profiler_remaining_runs = remaining - 1
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        pg.run() # st.rerun()/st.stop() inside the page raise through here; the run is still recorded
+    finally:
+        profiler.disable()
+        _record(profiler, pg.title, time.perf_counter() - started)
+
+def show_profiler_sidebar():
+    with st.sidebar.expander("性能分析 (管理员)"):
+        remaining = st.session_state.get("profiler_remaining_runs", 0)
+        runs = st.number_input("分析接下来的页面运行次数", min_value=1, max_value=20, value=3, key="profiler_runs_input")
+        if st.button("开始分析", key="profiler_start_btn"):
+            st.session_state.profiler_remaining_runs = runs
+            remaining = runs
+        if remaining:
+            st.caption(f"剩余 {remaining} 次运行将被分析（本会话）。")
+            if st.button("停止", key="profiler_stop_btn"):
+                st.session_state.profiler_remaining_runs = 0
+
+        results = st.session_state.get("profiler_results", [])
+        if not results:
+            return
+        labels = [f"{r['at']:%H:%M:%S} {r['page']} ({r['elapsed'] * 1000:.0f} ms)" for r in results]
+        chosen = st.selectbox("分析结果", options=range(len(results)), format_func=lambda i: labels[i], key="profiler_result_select")
+        st.caption(f"已保存：{results[chosen]['path']}")
+        st.dataframe(pd.DataFrame(results[chosen]["top"]), hide_index=True, use_container_width=True)
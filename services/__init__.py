@@ -0,0 +1,18 @@
+# services/__init__.py
+"""Booking and user logic without Streamlit.
+
+`database_utils.py` wraps these functions for the Streamlit pages (caching, st.error);
+`admin_cli.py` and background jobs call them directly.
+"""
+from services.config import load_config
+from services.db import Database
+from services.errors import (
+    BookingConflictError,
+    ConfigError,
+    DataAccessError,
+    DatabaseUnavailableError,
+    DuplicateStudentIdError,
+    QuotaExceededError,
+    ServiceError,
+    SlotAvailableError,
+)
@@ -0,0 +1,177 @@
+# services/audit.py
+"""Append-only audit trail of booking and user changes, written off the request path.
+
+Write functions call `record(db, ...)` after their transaction commits. That only puts the
+event on a bounded in-memory queue; a background thread drains the queue in batches to a
+sink (the `audit_log` table, or a local JSON-lines file) every `flush_interval` seconds or
+every `batch_size` events, whichever comes first. When the queue is full, events are
+dropped and counted rather than slowing down the write that produced them. `close()`
+(registered with atexit) drains what is left on shutdown.
+
+Config, all optional:
+    [audit]
+    sink = "database"        # or "file"
+    file_path = "audit.log"  # for sink = "file"
+    max_queue = 10000
+    batch_size = 200
+    flush_interval = 1.0
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_QUEUE = 10000
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+_INSERT_EVENT = (
+    "INSERT INTO audit_log (occurred_at, actor_id, source, action, target_type, target_id, details) "
+    "VALUES (%s, %s, %s, %s, %s, %s, %s)"
+)
+
+
+class DatabaseAuditSink:
+    def __init__(self, db):
+        self.db = db
+
+    def write(self, events):
+        with self.db.transaction() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany(_INSERT_EVENT, [
+                    (e["occurred_at"], e["actor_id"], e["source"], e["action"], e["target_type"], e["target_id"],
+                     json.dumps(e["details"], ensure_ascii=False, default=str))
+                    for e in events
+                ])
+            finally:
+                cursor.close()
+
+    def close(self):
+        self.db.close()
+
+
+class FileAuditSink:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def write(self, events):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for e in events:
+                f.write(json.dumps(e, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self):
+        pass
+
+
+class AuditLog:
+    def __init__(self, sink, max_queue=DEFAULT_MAX_QUEUE, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.sink = sink
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning("audit queue full, %d event(s) dropped so far", self.dropped)
+
+    def _take_batch(self):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self._flush_interval))
+            while len(batch) < self._batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._take_batch()
+            if not batch:
+                continue
+            try:
+                self.sink.write(batch)
+            except Exception:
+                # Losing a batch beats wedging the writer thread; the warning says how much
+                logger.exception("failed to write %d audit event(s)", len(batch))
+
+    def close(self, timeout=10):
+        """Drains what is queued to the sink, then closes it. Safe to call more than once."""
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self.sink.close()
+
+
+def create_audit_log(config, db_factory):
+    """Builds the AuditLog described by `config["audit"]`.
+
+    `db_factory()` returns a Database for the database sink; the audit writer gets its own
+    pool so it never competes with request threads for connections.
+    """
+    audit_config = config.get("audit", {})
+    if audit_config.get("sink", "database") == "file":
+        sink = FileAuditSink(audit_config.get("file_path", "audit.log"))
+    else:
+        sink = DatabaseAuditSink(db_factory())
+    return AuditLog(
+        sink,
+        max_queue=int(audit_config.get("max_queue", DEFAULT_MAX_QUEUE)),
+        batch_size=int(audit_config.get("batch_size", DEFAULT_BATCH_SIZE)),
+        flush_interval=float(audit_config.get("flush_interval", DEFAULT_FLUSH_INTERVAL)),
+    )
+
+
+def record(db, action, target_type, target_id, actor_id=None, source="web", **details):
+    """Queues one event on the audit log attached to `db`; a no-op if none is attached."""
+    if db.audit_log is None:
+        return
+    db.audit_log.record({
+        "occurred_at": datetime.now(),
+        "actor_id": actor_id,
+        "source": source,
+        "action": action,
+        "target_type": target_type,
+        "target_id": target_id,
+        "details": details,
+    })
+
+
+def query_events(db, start, end, action=None, actor_student_id=None, limit=200):
+    """Most recent events in [start, end), newest first. Only for the database sink."""
+    query = """
+        SELECT a.occurred_at, a.action, a.target_type, a.target_id, a.source, a.details,
+               u.student_id AS actor_student_id, u.name AS actor_name
+        FROM audit_log a LEFT JOIN users u ON a.actor_id = u.id
+        WHERE a.occurred_at >= %s AND a.occurred_at < %s
+    """
+    params = [start, end]
+    if action:
+        query += " AND a.action = %s"
+        params.append(action)
+    if actor_student_id:
+        query += " AND u.student_id = %s"
+        params.append(actor_student_id)
+    query += " ORDER BY a.occurred_at DESC LIMIT %s"
+    params.append(limit)
+    return db.fetch_all(query, tuple(params), routed=True)
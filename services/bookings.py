@@ -0,0 +1,320 @@
+# services/bookings.py
+"""Booking queries and mutations. Every function takes a `services.db.Database` first.
+
+Every path that removes a booking from a date (delete, move to another date, bulk cancel,
+user deletion) also writes a row to `booking_tombstones` in the same transaction, so
+delta readers (`get_booking_changes`) see removals as well as inserts and updates.
+Deletes and updates also promote waitlisted requests into the time they free (see
+services/waitlist.py), in that same transaction.
+"""
+from datetime import date, datetime, timedelta
+
+from services import audit, occupancy, quotas, reminders, statements, waitlist
+from services.errors import BookingConflictError, DataAccessError, QuotaExceededError
+
+# Tombstones older than this may be pruned; delta readers that fell further behind must reload
+TOMBSTONE_RETENTION = timedelta(hours=24)
+
+
+def get_bookings_for_date(db, booking_date):
+    return db.fetch_named("bookings_for_date", (booking_date,), routed=True)
+
+
+def get_booking_changes(db, booking_date, since=None):
+    """Bookings on booking_date changed at or after `since`, plus tombstones for removed ones.
+
+    Each row has `change_type` ('upsert' or 'delete') and `changed_at` (server time).
+    The lower bound is moved back by the replica lag allowance, because a replica - or a
+    transaction committing late - can surface a change stamped slightly before `since`;
+    re-applying the few overlapping rows is harmless. Both halves are range scans on
+    (booking_date, updated_at) / (booking_date, deleted_at).
+    """
+    if since is None:
+        since = datetime.min
+    else:
+        since = since - timedelta(seconds=max(db.replica_lag_allowance, 2))
+    return db.fetch_named("booking_changes", (booking_date, since, booking_date, since), routed=True)
+
+
+def prune_tombstones(db, older_than):
+    """Deletes tombstones recorded before `older_than`. Returns the number removed."""
+    return db.execute("DELETE FROM booking_tombstones WHERE deleted_at < %s", (older_than,))
+
+
+def get_bookings_filtered(db, display_start_date, user_id_to_filter=None):
+    if user_id_to_filter:
+        return db.fetch_named("bookings_from_date_for_user", (display_start_date, user_id_to_filter), routed=True)
+    return db.fetch_named("bookings_from_date", (display_start_date,), routed=True)
+
+
+def _conflict_statement(booking_date, start_time, end_time, exclude_booking_id):
+    if exclude_booking_id:
+        return "conflicts_excluding", (booking_date, start_time, end_time, exclude_booking_id)
+    return "conflicts", (booking_date, start_time, end_time)
+
+
+def find_conflicts_by_interval(db, booking_date, start_time, end_time, exclude_booking_id=None):
+    """The range-overlap scan over the day's bookings; the authority when occupancy bits collide."""
+    return db.fetch_named(*_conflict_statement(booking_date, start_time, end_time, exclude_booking_id))
+
+
+def _find_conflicts_in_transaction(conn, booking_date, start_time, end_time, exclude_booking_id=None):
+    return statements.run(conn, *_conflict_statement(booking_date, start_time, end_time, exclude_booking_id))
+
+
+def check_booking_conflict(db, booking_date, start_time, end_time, exclude_booking_id=None):
+    """Returns the bookings overlapping [start_time, end_time) on booking_date.
+
+    First a primary-key lookup of the day's occupancy mask: if no slot the request touches
+    is taken, there is no conflict. Otherwise (taken slots, or unaligned times sharing a
+    slot) the interval query decides and lists the conflicts for the caller to show.
+    Always answered by the primary: a lagging replica could miss the booking it must reject.
+    """
+    if not occupancy.get_day_mask(db, booking_date) & occupancy.slot_mask(start_time, end_time):
+        return []
+    return find_conflicts_by_interval(db, booking_date, start_time, end_time, exclude_booking_id)
+
+
+def create_booking(db, user_id, booking_date, start_time, end_time, attendees, purpose, actor_id=None):
+    """Inserts a booking and returns its id.
+
+    Raises BookingConflictError if the time is taken and QuotaExceededError if the user is
+    over quota. Locks are taken user first, then the day's occupancy row, so the checks
+    and the insert are atomic against other writers.
+    """
+    minutes = quotas.duration_minutes(start_time, end_time)
+    with db.transaction() as conn:
+        cursor = conn.cursor()
+        try:
+            user_row = _lock_user(cursor, user_id)
+            if occupancy.lock_day(cursor, booking_date) & occupancy.slot_mask(start_time, end_time):
+                conflicts = _find_conflicts_in_transaction(conn, booking_date, start_time, end_time)
+                if conflicts:
+                    raise BookingConflictError(conflicts)
+            booking_id = _insert_booking(cursor, user_id, booking_date, start_time, end_time, attendees, purpose)
+            quotas.enforce(cursor, db.config, user_id, user_row, booking_date, 1, minutes)
+        finally:
+            cursor.close()
+    audit.record(db, "booking.create", "booking", booking_id, actor_id, user_id=user_id,
+                 booking_date=booking_date, start_time=start_time, end_time=end_time,
+                 attendees=attendees, purpose=purpose)
+    reminders.booking_changed(db, booking_id, booking_date, start_time)
+    return booking_id
+
+
+def _insert_booking(cursor, user_id, booking_date, start_time, end_time, attendees, purpose):
+    """INSERT plus the derived-table upkeep; the caller holds the user and day locks."""
+    cursor.execute(
+        "INSERT INTO bookings (user_id, booking_date, start_time, end_time, attendees, purpose) VALUES (%s, %s, %s, %s, %s, %s)",
+        (user_id, booking_date, start_time, end_time, attendees, purpose)
+    )
+    booking_id = cursor.lastrowid
+    occupancy.add_to_day(cursor, booking_date, occupancy.slot_mask(start_time, end_time))
+    quotas.adjust(cursor, user_id, booking_date, 1, quotas.duration_minutes(start_time, end_time))
+    return booking_id
+
+
+def _promote_waiters(conn, cursor, config, booking_date):
+    """Books the date's waiting entries that fit now, oldest first; returns
+    [(entry_id, user_id, booking_id, start_time)].
+
+    Called after a write freed time, with the day's occupancy row locked and recomputed.
+    Lock order elsewhere is user before day, so a waiter's user row is taken with SKIP
+    LOCKED: a waiter in the middle of a write of their own is passed over this time rather
+    than risking a deadlock. Their time is then held: later entries overlapping it are not
+    promoted either, so the slot waits for the next write that frees time on this date
+    instead of going to someone who joined after them. Each attempt runs under a savepoint,
+    so a quota refusal undoes only that waiter's booking.
+    """
+    now = datetime.now()
+    if booking_date < now.date():
+        return []
+    entries = waitlist.lock_waiting(cursor, booking_date)
+    if not entries:
+        return []
+    cursor.execute("SELECT slot_mask FROM room_occupancy WHERE booking_date = %s", (booking_date,))
+    day_mask = int(cursor.fetchone()[0])
+    held = [] # (start, end) seconds of earlier waiters skipped because their user row was busy
+    promoted = []
+    for entry_id, user_id, start_time, end_time, attendees, purpose in entries:
+        if booking_date == now.date() and occupancy.time_to_seconds(start_time) <= occupancy.time_to_seconds(now.time()):
+            continue # Already started; stays waiting, but get_waiting_entries no longer lists it
+        request_mask = occupancy.slot_mask(start_time, end_time)
+        if day_mask & request_mask and _find_conflicts_in_transaction(conn, booking_date, start_time, end_time):
+            continue
+        start, end = occupancy.time_to_seconds(start_time), occupancy.time_to_seconds(end_time)
+        if any(start < held_end and held_start < end for held_start, held_end in held):
+            continue
+        user_row = quotas.lock_user(cursor, user_id, skip_locked=True)
+        if user_row is None:
+            held.append((start, end))
+            continue
+        cursor.execute("SAVEPOINT promote_waiter")
+        try:
+            booking_id = _insert_booking(cursor, user_id, booking_date, start_time, end_time, attendees, purpose)
+            quotas.enforce(cursor, config, user_id, user_row, booking_date, 1,
+                           quotas.duration_minutes(start_time, end_time))
+        except QuotaExceededError:
+            cursor.execute("ROLLBACK TO SAVEPOINT promote_waiter")
+            continue
+        waitlist.mark_promoted(cursor, entry_id, booking_id)
+        day_mask |= request_mask
+        promoted.append((entry_id, user_id, booking_id, start_time))
+    return promoted
+
+
+def _record_promotions(db, booking_date, promoted):
+    for entry_id, user_id, booking_id, start_time in promoted:
+        audit.record(db, "waitlist.promote", "booking", booking_id, user_id=user_id,
+                     waitlist_id=entry_id, booking_date=booking_date)
+        reminders.booking_changed(db, booking_id, booking_date, start_time)
+
+
+def _lock_user(cursor, user_id):
+    user_row = quotas.lock_user(cursor, user_id)
+    if user_row is None:
+        raise DataAccessError(f"user {user_id} does not exist")
+    return user_row
+
+
+def _lock_booking(cursor, booking_id):
+    """Locks the booking's owner, then the booking; returns (user_id, user_row, booking_date,
+    start_time, end_time), or None if it no longer exists.
+
+    Lock order everywhere is user, booking, day rows: writers cannot deadlock each other.
+    """
+    cursor.execute("SELECT user_id FROM bookings WHERE id = %s", (booking_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    user_id = row[0]
+    user_row = _lock_user(cursor, user_id)
+    cursor.execute("SELECT booking_date, start_time, end_time FROM bookings WHERE id = %s FOR UPDATE", (booking_id,))
+    row = cursor.fetchone()
+    return (user_id, user_row) + tuple(row) if row else None
+
+
+def update_booking(db, booking_id, booking_date, start_time, end_time, attendees, purpose, actor_id=None):
+    """Raises BookingConflictError if the new time overlaps another booking,
+    QuotaExceededError if the change takes the owner over quota."""
+    with db.transaction() as conn:
+        cursor = conn.cursor()
+        try:
+            locked = _lock_booking(cursor, booking_id)
+            if locked is None:
+                return # Deleted in the meantime
+            user_id, user_row, old_date, old_start, old_end = locked
+            # Lock both days in date order so concurrent moves cannot deadlock
+            day_masks = {day: occupancy.lock_day(cursor, day) for day in sorted({old_date, booking_date})}
+            if day_masks[booking_date] & occupancy.slot_mask(start_time, end_time):
+                conflicts = _find_conflicts_in_transaction(
+                    conn, booking_date, start_time, end_time, exclude_booking_id=booking_id
+                )
+                if conflicts:
+                    raise BookingConflictError(conflicts)
+            if old_date != booking_date:
+                # Moving to another date removes the booking from the old date's view
+                cursor.execute(
+                    "INSERT INTO booking_tombstones (booking_id, booking_date) VALUES (%s, %s)", (booking_id, old_date)
+                )
+            cursor.execute("""
+                UPDATE bookings SET booking_date=%s, start_time=%s, end_time=%s, attendees=%s, purpose=%s
+                WHERE id=%s
+            """, (booking_date, start_time, end_time, attendees, purpose, booking_id))
+            for day in day_masks:
+                occupancy.recompute_day(cursor, day)
+
+            old_minutes = quotas.duration_minutes(old_start, old_end)
+            new_minutes = quotas.duration_minutes(start_time, end_time)
+            quotas.adjust(cursor, user_id, old_date, -1, -old_minutes)
+            quotas.adjust(cursor, user_id, booking_date, 1, new_minutes)
+            today = date.today()
+            same_week = quotas.week_bounds(old_date) == quotas.week_bounds(booking_date)
+            quotas.enforce(
+                cursor, db.config, user_id, user_row, booking_date,
+                added_bookings=int(booking_date >= today) - int(old_date >= today),
+                added_minutes=new_minutes - (old_minutes if same_week else 0),
+            )
+            # Promote only once the update itself passed its checks: a refused update frees nothing
+            promoted = {day: _promote_waiters(conn, cursor, db.config, day) for day in day_masks}
+        finally:
+            cursor.close()
+    for day, day_promoted in promoted.items():
+        _record_promotions(db, day, day_promoted)
+    audit.record(db, "booking.update", "booking", booking_id, actor_id, old_date=old_date,
+                 booking_date=booking_date, start_time=start_time, end_time=end_time,
+                 attendees=attendees, purpose=purpose)
+    reminders.booking_changed(db, booking_id, booking_date, start_time)
+
+
+def delete_booking(db, booking_id, actor_id=None):
+    with db.transaction() as conn:
+        cursor = conn.cursor()
+        try:
+            locked = _lock_booking(cursor, booking_id)
+            if locked is None:
+                return
+            user_id, _, booking_date, start_time, end_time = locked
+            occupancy.lock_day(cursor, booking_date)
+            cursor.execute(
+                "INSERT INTO booking_tombstones (booking_id, booking_date) VALUES (%s, %s)", (booking_id, booking_date)
+            )
+            cursor.execute("DELETE FROM bookings WHERE id = %s", (booking_id,))
+            occupancy.recompute_day(cursor, booking_date)
+            quotas.adjust(cursor, user_id, booking_date, -1, -quotas.duration_minutes(start_time, end_time))
+            promoted = _promote_waiters(conn, cursor, db.config, booking_date)
+        finally:
+            cursor.close()
+    _record_promotions(db, booking_date, promoted)
+    audit.record(db, "booking.delete", "booking", booking_id, actor_id, booking_date=booking_date)
+    reminders.booking_removed(db, booking_id)
+
+
+# --- Bulk operations (admin_cli.py) ---
+def add_bookings_bulk(db, bookings):
+    """Inserts (user_id, booking_date, start_time, end_time, attendees, purpose) tuples
+    in one multi-row INSERT. No conflict checking: meant for seeding empty databases."""
+    bookings = list(bookings)
+    with db.transaction() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(
+                "INSERT INTO bookings (user_id, booking_date, start_time, end_time, attendees, purpose) VALUES (%s, %s, %s, %s, %s, %s)",
+                bookings
+            )
+            inserted = cursor.rowcount
+            if bookings:
+                dates = [b[1] for b in bookings]
+                occupancy.recompute_days(cursor, min(dates), max(dates))
+                quotas.recompute_days(cursor, min(dates), max(dates))
+        finally:
+            cursor.close()
+    audit.record(db, "booking.bulk_insert", "booking", None, source="cli", inserted=inserted)
+    return inserted
+
+
+def cancel_bookings_in_range(db, start_date, end_date, user_id=None):
+    """Deletes every booking dated start_date..end_date (inclusive) with one set-based DELETE,
+    preceded by the matching tombstone INSERT ... SELECT. Returns the number of bookings deleted.
+    """
+    condition = "booking_date BETWEEN %s AND %s"
+    params = [start_date, end_date]
+    if user_id:
+        condition += " AND user_id = %s"
+        params.append(user_id)
+    with db.transaction() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "INSERT INTO booking_tombstones (booking_id, booking_date) SELECT id, booking_date FROM bookings WHERE " + condition,
+                tuple(params)
+            )
+            cursor.execute("DELETE FROM bookings WHERE " + condition, tuple(params))
+            deleted = cursor.rowcount
+            occupancy.recompute_days(cursor, start_date, end_date)
+            quotas.recompute_days(cursor, start_date, end_date)
+        finally:
+            cursor.close()
+    audit.record(db, "booking.bulk_cancel", "booking", None, source="cli", start_date=start_date,
+                 end_date=end_date, user_id=user_id, deleted=deleted)
+    return deleted
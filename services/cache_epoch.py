@@ -0,0 +1,22 @@
+# services/cache_epoch.py
+"""Cross-process cache invalidation through a marker file.
+
+Writers that run outside the Streamlit process (admin_cli.py, cron jobs) call `bump()`;
+the app compares `current()` once per rerun (a single stat call) and drops its
+st.cache_data entries when the value changed.
+"""
+import os
+import time
+
+
+def current(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def bump(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(str(time.time_ns()))
@@ -0,0 +1,26 @@
+# services/config.py
+"""Loads the same TOML file Streamlit reads as `st.secrets`, for use outside Streamlit."""
+import os
+
+import toml
+
+from services.errors import ConfigError
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SECRETS_PATH = os.path.join(PROJECT_ROOT, ".streamlit", "secrets.toml")
+DEFAULT_CACHE_EPOCH_PATH = os.path.join(PROJECT_ROOT, ".streamlit", "cache_epoch")
+
+
+def load_config(path=None):
+    """Reads the config file: `path`, else $RFA_SECRETS_FILE, else .streamlit/secrets.toml."""
+    path = path or os.environ.get("RFA_SECRETS_FILE") or DEFAULT_SECRETS_PATH
+    try:
+        return toml.load(path)
+    except FileNotFoundError as e:
+        raise ConfigError(f"config file not found: {path}") from e
+    except toml.TomlDecodeError as e:
+        raise ConfigError(f"invalid config file {path}: {e}") from e
+
+
+def cache_epoch_path(config):
+    return config.get("app", {}).get("cache_epoch_file", DEFAULT_CACHE_EPOCH_PATH)
@@ -0,0 +1,46 @@
+# services/day_board.py
+"""In-memory view of one day's bookings, kept current by applying deltas.
+
+The board starts from a full day listing (`bookings.get_bookings_for_date`) and then only
+asks for rows changed since its watermark (`bookings.get_booking_changes`). Deleted or
+moved-away bookings arrive as tombstones.
+"""
+
+
+class DayBoard:
+    def __init__(self, booking_date, rows):
+        self.booking_date = booking_date
+        self._rows = {}
+        self.watermark = None # Latest server-side change time seen; None = nothing seen yet
+        self._upsert(rows)
+
+    def _upsert(self, rows):
+        for row in rows:
+            self._rows[row["id"]] = row
+            self._advance(row["updated_at"])
+
+    def _advance(self, changed_at):
+        if changed_at is not None and (self.watermark is None or changed_at > self.watermark):
+            self.watermark = changed_at
+
+    def apply(self, changes):
+        """Patches the board with rows from `get_booking_changes`. Returns True if anything changed.
+
+        Tombstones are applied before upserts: a row that still comes back for this date
+        is current, even if it was moved away and back again.
+        """
+        changed = False
+        for change in changes:
+            if change["change_type"] == "delete":
+                changed |= self._rows.pop(change["id"], None) is not None
+                self._advance(change["changed_at"])
+        for change in changes:
+            if change["change_type"] == "upsert":
+                row = {k: v for k, v in change.items() if k not in ("change_type", "changed_at")}
+                row["updated_at"] = change["changed_at"]
+                changed |= self._rows.get(row["id"]) != row
+                self._upsert([row])
+        return changed
+
+    def rows(self):
+        return sorted(self._rows.values(), key=lambda r: r["start_time"])
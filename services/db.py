@@ -0,0 +1,222 @@
+# services/db.py
+"""Pooled MySQL access with read/write routing.
+
+Lag-tolerant reads can be served by replicas (`[[database_replicas]]`); everything else
+uses the primary (`[database]`). For `read_your_writes_seconds` after a commit made
+through this object, routed reads also go to the primary, so a caller - and any cache
+refilled right after the write - never sees its own write missing because of replica lag.
+"""
+import itertools
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error
+
+from services import statements
+from services.errors import ConfigError, DataAccessError, DatabaseUnavailableError
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_POOL_TIMEOUT = 10
+DEFAULT_READ_YOUR_WRITES_SECONDS = 5.0
+
+# Errors after which a connection is not worth returning to the pool
+_BROKEN_CONNECTION_ERRORS = (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)
+
+
+@contextmanager
+def _translate_errors():
+    try:
+        yield
+    except Error as e:
+        raise DataAccessError(str(e), errno=e.errno) from e
+
+
+class ConnectionPool:
+    """Blocking pool: connections are opened lazily, up to `size`, and reused LIFO."""
+
+    def __init__(self, db_config, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_POOL_TIMEOUT):
+        self.db_config = db_config
+        self._timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _open(self):
+        try:
+            return mysql.connector.connect(
+                host=self.db_config["host"],
+                port=self.db_config.get("port", 3306),
+                user=self.db_config["user"],
+                password=self.db_config["password"],
+                database=self.db_config["database_name"],
+                autocommit=True, # Plain reads must not pin an old snapshot; writes use transaction()
+                use_pure=not mysql.connector.HAVE_CEXT, # C extension when it is installed
+            )
+        except KeyError as e:
+            raise ConfigError(f"database config is missing {e}") from e
+        except Error as e:
+            raise DatabaseUnavailableError(
+                f"cannot connect to {self.db_config.get('host')}:{self.db_config.get('port', 3306)}: {e}"
+            ) from e
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self._timeout):
+            raise DatabaseUnavailableError("timed out waiting for a pooled connection")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._open()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        if discard:
+            try:
+                conn.close()
+            except Error:
+                pass
+        else:
+            self._idle.put(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except _BROKEN_CONNECTION_ERRORS:
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard)
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                conn.close()
+            except Error:
+                pass
+
+
+class Database:
+    """Entry point handed to every service function.
+
+    `config` is the parsed secrets mapping (`st.secrets.to_dict()` or `config.load_config()`).
+    """
+
+    def __init__(self, config):
+        if "database" not in config:
+            raise ConfigError("missing [database] section")
+        self.config = config
+        routing = config.get("database_routing", {})
+        pool_size = int(routing.get("pool_size", DEFAULT_POOL_SIZE))
+        self._primary = ConnectionPool(config["database"], pool_size)
+        self._replicas = [ConnectionPool(c, pool_size) for c in config.get("database_replicas", [])]
+        self._read_your_writes_seconds = float(
+            routing.get("read_your_writes_seconds", DEFAULT_READ_YOUR_WRITES_SECONDS)
+        )
+        self._last_write_at = 0.0
+        self._round_robin = itertools.count()
+        self.audit_log = None # Set by the caller to an audit.AuditLog to record changes
+        self.reminders = None # Set by the caller to a reminders.ReminderScheduler to keep it in sync
+
+    @property
+    def replica_lag_allowance(self):
+        """Seconds of replica lag the routing tolerates (the read-your-writes window)."""
+        return self._read_your_writes_seconds
+
+    def mark_write(self):
+        self._last_write_at = time.monotonic()
+
+    def _read_pool(self):
+        if not self._replicas or time.monotonic() - self._last_write_at < self._read_your_writes_seconds:
+            return self._primary
+        return self._replicas[next(self._round_robin) % len(self._replicas)]
+
+    @contextmanager
+    def connection(self):
+        """Autocommit connection to the primary, for reads that must be current."""
+        with _translate_errors(), self._primary.connection() as conn:
+            yield conn
+
+    @contextmanager
+    def transaction(self):
+        """Primary connection inside a transaction; commits on success, rolls back on any error."""
+        with _translate_errors(), self._primary.connection() as conn:
+            conn.start_transaction()
+            try:
+                yield conn
+            except BaseException:
+                try:
+                    conn.rollback()
+                except Error:
+                    pass
+                raise
+            conn.commit()
+        self.mark_write()
+
+    def fetch_all(self, query, params=(), routed=False):
+        """Runs a SELECT and returns a list of dicts. `routed=True` allows a replica to answer."""
+        return self._read(lambda conn: self._fetch_text(conn, query, params), routed)
+
+    def fetch_one(self, query, params=()):
+        rows = self.fetch_all(query, params)
+        return rows[0] if rows else None
+
+    def fetch_named(self, name, params=(), routed=False):
+        """Like fetch_all, for a statement in `services.statements`, run prepared."""
+        return self._read(lambda conn: statements.run(conn, name, params), routed)
+
+    def fetch_named_one(self, name, params=()):
+        rows = self.fetch_named(name, params)
+        return rows[0] if rows else None
+
+    def _read(self, fetch, routed):
+        pool = self._read_pool() if routed else self._primary
+        if pool is not self._primary:
+            try:
+                return self._fetch_on(pool, fetch)
+            except (DatabaseUnavailableError, DataAccessError) as e:
+                if isinstance(e, DataAccessError) and not isinstance(e.__cause__, _BROKEN_CONNECTION_ERRORS):
+                    raise
+                # The replica is down or dropped the connection; the primary can still answer
+        return self._fetch_on(self._primary, fetch)
+
+    @staticmethod
+    def _fetch_on(pool, fetch):
+        with _translate_errors(), pool.connection() as conn:
+            return fetch(conn)
+
+    @staticmethod
+    def _fetch_text(conn, query, params):
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def execute(self, query, params=()):
+        """Runs a single write statement in its own transaction and returns the affected row count."""
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(query, params)
+                return cursor.rowcount
+            finally:
+                cursor.close()
+
+    def close(self):
+        self._primary.close()
+        for replica in self._replicas:
+            replica.close()
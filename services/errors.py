@@ -0,0 +1,61 @@
+# services/errors.py
+"""Exception types raised by the service layer.
+
+Callers (Streamlit pages, admin_cli.py, background jobs) decide how to report them;
+nothing in `services` prints or touches Streamlit.
+"""
+
+
+class ServiceError(Exception):
+    """Base class for every error raised by the service layer."""
+
+
+class ConfigError(ServiceError):
+    """The secrets/config file is missing or incomplete."""
+
+
+class DatabaseUnavailableError(ServiceError):
+    """No connection to the database could be obtained."""
+
+
+class DataAccessError(ServiceError):
+    """A query failed. `errno` carries the MySQL error number when there is one."""
+
+    def __init__(self, message, errno=None):
+        super().__init__(message)
+        self.errno = errno
+
+
+class DuplicateStudentIdError(ServiceError):
+    """A user with this student ID already exists."""
+
+    def __init__(self, student_id):
+        super().__init__(f"student_id {student_id!r} already exists")
+        self.student_id = student_id
+
+
+class BookingConflictError(ServiceError):
+    """The requested time overlaps existing bookings, listed in `conflicts`."""
+
+    def __init__(self, conflicts):
+        super().__init__(f"time slot overlaps {len(conflicts)} existing booking(s)")
+        self.conflicts = conflicts
+
+
+class SlotAvailableError(ServiceError):
+    """A waitlist join found the requested time free: it can be booked directly."""
+
+    def __init__(self):
+        super().__init__("time slot is free; book it instead of joining the waitlist")
+
+
+class QuotaExceededError(ServiceError):
+    """The write would take the user over a booking quota.
+
+    `quota` is "max_active_bookings" or "max_hours_per_week"; `limit` is its configured value.
+    """
+
+    def __init__(self, quota, limit):
+        super().__init__(f"{quota} quota of {limit} exceeded")
+        self.quota = quota
+        self.limit = limit
@@ -0,0 +1,129 @@
+# services/occupancy.py
+"""Per-day occupancy bitmap: bit i of `room_occupancy.slot_mask` is set when any booking
+touches the half-hour slot starting at i * 30 minutes.
+
+A booking that is not half-hour aligned sets every slot it touches, so the mask is always
+a superset of the real occupancy: a zero AND with a request proves there is no conflict,
+while a non-zero AND only means "maybe" and is settled by the interval query. Masks are
+maintained in the same transaction as the bookings they describe; bitwise OR on insert,
+and a recompute from the day's bookings on update/delete (clearing bits directly would be
+wrong when two unaligned bookings share a slot).
+"""
+from datetime import time, timedelta
+
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES # 48, fits a BIGINT
+_SLOT_SECONDS = SLOT_MINUTES * 60
+
+# Covering mask of one booking, computed by MySQL: bits floor(start/slot) .. ceil(end/slot) - 1
+_BOOKING_MASK_SQL = (
+    f"((1 << CEIL(TIME_TO_SEC(end_time) / {_SLOT_SECONDS})) - (1 << FLOOR(TIME_TO_SEC(start_time) / {_SLOT_SECONDS})))"
+)
+
+
+def time_to_seconds(value):
+    """Seconds since midnight for a datetime.time or the timedelta MySQL returns for TIME."""
+    if isinstance(value, timedelta):
+        return int(value.total_seconds())
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def is_aligned(start_time, end_time):
+    return time_to_seconds(start_time) % _SLOT_SECONDS == 0 and time_to_seconds(end_time) % _SLOT_SECONDS == 0
+
+
+def slot_mask(start_time, end_time):
+    """Covering mask of [start_time, end_time)."""
+    first = time_to_seconds(start_time) // _SLOT_SECONDS
+    last = -(-time_to_seconds(end_time) // _SLOT_SECONDS) # ceil
+    if last <= first:
+        return 0
+    return (1 << last) - (1 << first)
+
+
+def mask_for_bookings(bookings):
+    mask = 0
+    for b in bookings:
+        mask |= slot_mask(b["start_time"], b["end_time"])
+    return mask
+
+
+def free_ranges(mask):
+    """Free (start, end) times for a day mask, by scanning runs of zero bits.
+
+    The end of a range that reaches midnight is returned as time.max.
+    """
+    ranges = []
+    slot = 0
+    while slot < SLOTS_PER_DAY:
+        if mask >> slot & 1:
+            slot += 1
+            continue
+        run_start = slot
+        while slot < SLOTS_PER_DAY and not mask >> slot & 1:
+            slot += 1
+        start_minutes, end_minutes = run_start * SLOT_MINUTES, slot * SLOT_MINUTES
+        end = time.max if end_minutes == 24 * 60 else time(end_minutes // 60, end_minutes % 60)
+        ranges.append((time(start_minutes // 60, start_minutes % 60), end))
+    return ranges
+
+
+# --- Maintenance, called with a cursor inside the caller's transaction ---
+def lock_day(cursor, booking_date):
+    """Row-locks the day's mask (creating it if needed) and returns it.
+
+    Every booking write for a date goes through this lock first, so conflict check and
+    insert are atomic with respect to other writers on the same day.
+    """
+    # ON DUPLICATE KEY takes the exclusive lock straight away; INSERT IGNORE would take a
+    # shared one first and two writers upgrading it would deadlock
+    cursor.execute(
+        "INSERT INTO room_occupancy (booking_date, slot_mask) VALUES (%s, 0) ON DUPLICATE KEY UPDATE slot_mask = slot_mask",
+        (booking_date,)
+    )
+    cursor.execute("SELECT slot_mask FROM room_occupancy WHERE booking_date = %s FOR UPDATE", (booking_date,))
+    return int(cursor.fetchone()[0])
+
+
+def add_to_day(cursor, booking_date, mask):
+    cursor.execute(
+        "UPDATE room_occupancy SET slot_mask = slot_mask | %s WHERE booking_date = %s", (mask, booking_date)
+    )
+
+
+def recompute_days(cursor, start_date, end_date):
+    """Rebuilds the masks for start_date..end_date (inclusive) from `bookings` in two set-based statements."""
+    cursor.execute(
+        "UPDATE room_occupancy SET slot_mask = 0 WHERE booking_date BETWEEN %s AND %s", (start_date, end_date)
+    )
+    cursor.execute(f"""
+        INSERT INTO room_occupancy (booking_date, slot_mask)
+        SELECT booking_date, BIT_OR({_BOOKING_MASK_SQL}) FROM bookings
+        WHERE booking_date BETWEEN %s AND %s
+        GROUP BY booking_date
+        ON DUPLICATE KEY UPDATE slot_mask = VALUES(slot_mask)
+    """, (start_date, end_date))
+
+
+def recompute_day(cursor, booking_date):
+    recompute_days(cursor, booking_date, booking_date)
+
+
+def rebuild_all(db):
+    """Recomputes every stored mask from scratch. Returns the number of days with bookings."""
+    with db.transaction() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM room_occupancy")
+            cursor.execute(f"""
+                INSERT INTO room_occupancy (booking_date, slot_mask)
+                SELECT booking_date, BIT_OR({_BOOKING_MASK_SQL}) FROM bookings GROUP BY booking_date
+            """)
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+
+def get_day_mask(db, booking_date):
+    row = db.fetch_named_one("day_mask", (booking_date,))
+    return int(row["slot_mask"]) if row else 0
@@ -0,0 +1,141 @@
+# services/quotas.py
+"""Per-user booking quotas, enforced from `booking_counters` instead of scanning `bookings`.
+
+`booking_counters` holds one row per (user, date) with the number of bookings and booked
+minutes. Booking writes adjust it in the same transaction, so a quota check is a primary-key
+range read of a handful of rows (bookings can only be made a week ahead). Bulk paths
+recompute the affected date range, and `reconcile` rebuilds everything and reports drift.
+
+Config, all optional (no [quotas] section means no limits; 0 also means unlimited):
+    [quotas]
+    max_active_bookings = 5      # bookings dated today or later
+    max_hours_per_week = 6       # per Monday-Sunday week
+    [quotas.roles.admin]         # overrides by role
+    max_active_bookings = 0
+    [quotas.users."202330351561"]  # overrides by student ID, win over the role
+    max_hours_per_week = 20
+"""
+from datetime import date, timedelta
+
+from services.errors import QuotaExceededError
+from services.occupancy import time_to_seconds
+
+_MINUTES_SQL = "SUM((TIME_TO_SEC(end_time) - TIME_TO_SEC(start_time)) DIV 60)"
+
+
+def duration_minutes(start_time, end_time):
+    return (time_to_seconds(end_time) - time_to_seconds(start_time)) // 60
+
+
+def week_bounds(booking_date):
+    monday = booking_date - timedelta(days=booking_date.weekday())
+    return monday, monday + timedelta(days=6)
+
+
+def limits_for(config, role, student_id):
+    """(max_active_bookings, max_hours_per_week) for a user; None means unlimited."""
+    quota_config = config.get("quotas", {})
+    merged = {k: v for k, v in quota_config.items() if k in ("max_active_bookings", "max_hours_per_week")}
+    merged.update(quota_config.get("roles", {}).get(role, {}))
+    merged.update(quota_config.get("users", {}).get(student_id, {}))
+    return (merged.get("max_active_bookings") or None, merged.get("max_hours_per_week") or None)
+
+
+# --- Called with a cursor inside the caller's transaction ---
+def lock_user(cursor, user_id, skip_locked=False):
+    """Row-locks the user, serialising that user's booking writes, and returns (role, student_id).
+
+    With `skip_locked`, returns None instead of waiting if another transaction holds the lock.
+    """
+    cursor.execute(
+        "SELECT role, student_id FROM users WHERE id = %s FOR UPDATE" + (" SKIP LOCKED" if skip_locked else ""),
+        (user_id,)
+    )
+    return cursor.fetchone()
+
+
+def adjust(cursor, user_id, booking_date, count_delta, minutes_delta):
+    cursor.execute("""
+        INSERT INTO booking_counters (user_id, booking_date, booking_count, booked_minutes)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE booking_count = booking_count + VALUES(booking_count),
+                                booked_minutes = booked_minutes + VALUES(booked_minutes)
+    """, (user_id, booking_date, count_delta, minutes_delta))
+
+
+def enforce(cursor, config, user_id, user_row, booking_date, added_bookings, added_minutes):
+    """Raises QuotaExceededError if the counters, already adjusted for this write, are over a limit
+    that this write pushed further (so shrinking a booking is allowed even when over quota)."""
+    max_active, max_week_hours = limits_for(config, user_row[0], user_row[1])
+    if not max_active and not max_week_hours:
+        return
+    today = date.today()
+    monday, sunday = week_bounds(booking_date)
+    cursor.execute("""
+        SELECT COALESCE(SUM(CASE WHEN booking_date >= %s THEN booking_count END), 0),
+               COALESCE(SUM(CASE WHEN booking_date BETWEEN %s AND %s THEN booked_minutes END), 0)
+        FROM booking_counters
+        WHERE user_id = %s AND booking_date >= %s
+    """, (today, monday, sunday, user_id, min(today, monday)))
+    active, week_minutes = (int(v) for v in cursor.fetchone())
+    if max_active and added_bookings > 0 and active > max_active:
+        raise QuotaExceededError("max_active_bookings", max_active)
+    if max_week_hours and added_minutes > 0 and week_minutes > max_week_hours * 60:
+        raise QuotaExceededError("max_hours_per_week", max_week_hours)
+
+
+def recompute_days(cursor, start_date, end_date):
+    """Rebuilds the counters for start_date..end_date (inclusive) from `bookings`, set-based."""
+    cursor.execute("DELETE FROM booking_counters WHERE booking_date BETWEEN %s AND %s", (start_date, end_date))
+    cursor.execute(f"""
+        INSERT INTO booking_counters (user_id, booking_date, booking_count, booked_minutes)
+        SELECT user_id, booking_date, COUNT(*), {_MINUTES_SQL} FROM bookings
+        WHERE booking_date BETWEEN %s AND %s
+        GROUP BY user_id, booking_date
+    """, (start_date, end_date))
+
+
+def _rebuild_all(cursor):
+    cursor.execute("DELETE FROM booking_counters")
+    cursor.execute(f"""
+        INSERT INTO booking_counters (user_id, booking_date, booking_count, booked_minutes)
+        SELECT user_id, booking_date, COUNT(*), {_MINUTES_SQL} FROM bookings
+        GROUP BY user_id, booking_date
+    """)
+    return cursor.rowcount
+
+
+def rebuild_all(db):
+    with db.transaction() as conn:
+        cursor = conn.cursor()
+        try:
+            return _rebuild_all(cursor)
+        finally:
+            cursor.close()
+
+
+def reconcile(db):
+    """Counts (user, date) counters that drifted from `bookings` and rebuilds them, in one transaction.
+
+    Returns the number of drifted entries found.
+    """
+    aggregate = f"SELECT user_id, booking_date, COUNT(*) AS n, {_MINUTES_SQL} AS m FROM bookings GROUP BY user_id, booking_date"
+    with db.transaction() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT
+                    (SELECT COUNT(*) FROM booking_counters c LEFT JOIN ({aggregate}) a
+                         ON a.user_id = c.user_id AND a.booking_date = c.booking_date
+                     WHERE (a.n IS NULL AND (c.booking_count <> 0 OR c.booked_minutes <> 0))
+                        OR a.n <> c.booking_count OR a.m <> c.booked_minutes)
+                  + (SELECT COUNT(*) FROM ({aggregate}) a LEFT JOIN booking_counters c
+                         ON a.user_id = c.user_id AND a.booking_date = c.booking_date
+                     WHERE c.user_id IS NULL)
+            """)
+            drifted = int(cursor.fetchone()[0])
+            if drifted:
+                _rebuild_all(cursor)
+            return drifted
+        finally:
+            cursor.close()
@@ -0,0 +1,460 @@
+# services/reminders.py
+"""Booking reminders N minutes before the start, and a daily booking digest for admins.
+
+A background thread keeps a min-heap of upcoming deliveries ordered by due time and sleeps
+until the earliest one: no table scan per minute. The heap is loaded from `bookings` for the
+next `horizon_hours` at start (restart recovery: reminders that fell due while the process
+was down and whose booking has not started yet go out immediately), reloaded hourly and
+when `reload()` is called, and kept current by the booking write paths through
+`booking_changed` / `booking_removed`. Moved or deleted bookings leave their old heap entry
+behind; it is recognised as stale when popped and dropped.
+
+Due deliveries go out in batches to a sink (SMTP, webhook, JSON-lines file or in-memory).
+Before sending, each delivery is claimed with INSERT IGNORE on `reminder_deliveries`, so
+when several app processes run a scheduler only one of them sends it. `sent_at` is recorded
+per message as the sink reports it delivered; when a batch fails partway only the unsent
+claims are released and retried. A claim still unsent after CLAIM_LEASE (its process died
+mid-batch) is released by the next load in any process and sent again, as long as the
+booking has not started. So each delivery goes out once; the exception is a crash between
+a message leaving and its `sent_at` being written, which sends that one message twice.
+
+Config, all optional (no [reminders] section or enabled = false means no scheduler):
+    [reminders]
+    enabled = true
+    lead_minutes = 15
+    horizon_hours = 24
+    batch_size = 50
+    digest_time = "08:00"        # daily admin digest of the day's bookings; leave out to disable
+    sink = "file"                # "smtp", "webhook", "file" or "memory"
+    file_path = "reminders.log"
+    webhook_url = "https://example.com/hooks/rfa"
+    smtp_host = "smtp.example.com"
+    smtp_port = 587
+    smtp_user = "rfa@example.com"
+    smtp_password = "change-me"
+    smtp_from = "rfa@example.com"
+    email_domain = "example.edu"   # recipient address is <student_id>@<email_domain>
+"""
+import atexit
+import heapq
+import itertools
+import json
+import logging
+import os
+import smtplib
+import threading
+import urllib.request
+import uuid
+from datetime import datetime, time, timedelta
+from email.message import EmailMessage
+
+from services.occupancy import time_to_seconds
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEAD_MINUTES = 15
+DEFAULT_HORIZON_HOURS = 24
+DEFAULT_BATCH_SIZE = 50
+RELOAD_INTERVAL = timedelta(hours=1)
+RETRY_DELAY = timedelta(minutes=1)
+DELIVERY_RETENTION = timedelta(days=7)
+CLAIM_LEASE = timedelta(minutes=15) # Far longer than sending one batch takes
+
+_BOOKING = "booking"
+_DIGEST = "digest"
+
+
+def _start_at(booking_date, start_time):
+    return datetime.combine(booking_date, time.min) + timedelta(seconds=time_to_seconds(start_time))
+
+
+def _booking_key(booking_id, start_at):
+    # Includes the start, so a booking moved to another time gets a fresh reminder
+    return f"{_BOOKING}:{booking_id}:{start_at:%Y%m%dT%H%M}"
+
+
+def _format_time(value):
+    seconds = time_to_seconds(value)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}"
+
+
+# --- Sinks: send(messages, delivered) calls delivered(message) for each message once it is
+# out, and raises on the first failure; messages not reported delivered count as unsent ---
+class MemoryReminderSink:
+    """Keeps messages in `sent`; a stand-in for tests and local runs."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, messages, delivered):
+        for m in messages:
+            self.sent.append(m)
+            delivered(m)
+
+
+class FileReminderSink:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def send(self, messages, delivered):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for m in messages:
+                f.write(json.dumps(m, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+                delivered(m)
+
+
+class WebhookReminderSink:
+    """POSTs {"messages": [...]} as JSON; any non-2xx response fails the batch."""
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, messages, delivered):
+        body = json.dumps({"messages": messages}, ensure_ascii=False, default=str).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass # urlopen raises HTTPError on 4xx/5xx
+        for m in messages: # One request carries the whole batch
+            delivered(m)
+
+
+class SmtpReminderSink:
+    """One SMTP session per batch; recipients are `<student_id>@<email_domain>`."""
+
+    def __init__(self, host, port, sender, email_domain, username=None, password=None, starttls=True):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.email_domain = email_domain
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+
+    def send(self, messages, delivered):
+        with smtplib.SMTP(self.host, self.port, timeout=30) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            for m in messages:
+                email = EmailMessage()
+                email["From"] = self.sender
+                email["To"] = ", ".join(f"{sid}@{self.email_domain}" for sid in m["recipients"])
+                email["Subject"] = m["subject"]
+                email.set_content(m["body"])
+                smtp.send_message(email)
+                delivered(m)
+
+
+class ReminderScheduler:
+    def __init__(self, db, sink, lead_minutes=DEFAULT_LEAD_MINUTES, horizon_hours=DEFAULT_HORIZON_HOURS,
+                 batch_size=DEFAULT_BATCH_SIZE, digest_time=None):
+        self.db = db
+        self.sink = sink
+        self._lead = timedelta(minutes=lead_minutes)
+        self._horizon = timedelta(hours=horizon_hours)
+        self._batch_size = batch_size
+        self._digest_time = digest_time
+        self._heap = [] # (due_at, seq, kind, key, payload)
+        self._seq = itertools.count()
+        self._booking_keys = {} # booking id -> key of its live heap entry
+        self._done_keys = set() # Sent (or claimed elsewhere) keys still inside the window
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._reload_requested = True
+        self._next_reload = datetime.min
+        self._changes_during_load = None # Write-path changes seen while _load reads the table
+        self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # --- Called by the booking write paths (any thread) ---
+    def booking_changed(self, booking_id, booking_date, start_time):
+        with self._cond:
+            self._apply_change(booking_id, _start_at(booking_date, start_time))
+            self._cond.notify()
+
+    def booking_removed(self, booking_id):
+        with self._cond:
+            self._apply_change(booking_id, None) # The heap entry goes stale
+
+    def _apply_change(self, booking_id, start_at):
+        if self._changes_during_load is not None:
+            self._changes_during_load.append((booking_id, start_at)) # Replayed over the fresh heap
+        now = datetime.now()
+        if start_at is None or not now < start_at <= now + self._horizon:
+            self._booking_keys.pop(booking_id, None)
+            return
+        key = _booking_key(booking_id, start_at)
+        if self._booking_keys.get(booking_id) == key:
+            return
+        self._booking_keys[booking_id] = key
+        self._push(max(start_at - self._lead, now), _BOOKING, key, booking_id)
+
+    def reload(self):
+        """Reloads the window from the database on the scheduler thread, e.g. after bulk changes."""
+        with self._cond:
+            self._reload_requested = True
+            self._cond.notify()
+
+    def close(self, timeout=10):
+        with self._cond:
+            if self._stopping:
+                return
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    # --- Scheduler thread ---
+    def _push(self, due_at, kind, key, payload):
+        heapq.heappush(self._heap, (due_at, next(self._seq), kind, key, payload))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                reload = self._reload_requested or datetime.now() >= self._next_reload
+                self._reload_requested = False
+            if reload:
+                try:
+                    self._load()
+                except Exception:
+                    logger.exception("failed to load upcoming reminders")
+                    self._next_reload = datetime.now() + RETRY_DELAY
+            with self._cond:
+                if self._stopping:
+                    return
+                now = datetime.now()
+                due = self._pop_due(now)
+                if not due:
+                    wake_at = min(self._heap[0][0], self._next_reload) if self._heap else self._next_reload
+                    self._cond.wait(max((wake_at - now).total_seconds(), 0.01))
+                    continue
+            try:
+                self._dispatch(due)
+            except Exception:
+                logger.exception("failed to send %d reminder(s); retrying later", len(due))
+                with self._cond:
+                    retry_at = datetime.now() + RETRY_DELAY
+                    for _, _, kind, key, payload in due:
+                        self._push(retry_at, kind, key, payload)
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self._batch_size:
+            entry = heapq.heappop(self._heap)
+            _, _, kind, key, payload = entry
+            if key in self._done_keys:
+                continue
+            if kind == _BOOKING and self._booking_keys.get(payload) != key:
+                continue # Booking moved or deleted since this entry was pushed
+            due.append(entry)
+        return due
+
+    def _reclaim_expired(self, now):
+        """Releases claims left unsent past CLAIM_LEASE (their process died mid-batch).
+
+        Returns (released keys, claimed_at of the oldest unsent claim still within its lease or None).
+        """
+        with self.db.transaction() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    "SELECT delivery_key FROM reminder_deliveries WHERE sent_at IS NULL AND claimed_at < %s FOR UPDATE",
+                    (now - CLAIM_LEASE,)
+                )
+                released = {row[0] for row in cursor.fetchall()}
+                if released:
+                    cursor.execute(
+                        "DELETE FROM reminder_deliveries WHERE sent_at IS NULL AND claimed_at < %s", (now - CLAIM_LEASE,)
+                    )
+                cursor.execute("SELECT MIN(claimed_at) FROM reminder_deliveries WHERE sent_at IS NULL")
+                oldest_pending = cursor.fetchone()[0]
+                return released, oldest_pending
+            finally:
+                cursor.close()
+
+    def _load(self):
+        now = datetime.now()
+        until = now + self._horizon
+        self.db.execute("DELETE FROM reminder_deliveries WHERE claimed_at < %s", (now - DELIVERY_RETENTION,))
+        released, oldest_pending = self._reclaim_expired(now)
+        with self._cond:
+            self._changes_during_load = []
+        try:
+            rows = self._fetch_window(now, until)
+        except BaseException:
+            with self._cond:
+                self._changes_during_load = None
+            raise
+        heap, booking_keys = [], {}
+        for row in rows:
+            start_at = _start_at(row["booking_date"], row["start_time"])
+            if now < start_at <= until:
+                key = _booking_key(row["id"], start_at)
+                booking_keys[row["id"]] = key
+                heap.append((max(start_at - self._lead, now), next(self._seq), _BOOKING, key, row["id"]))
+        if self._digest_time:
+            digest_at = datetime.combine(now.date(), self._digest_time)
+            if digest_at < now - timedelta(hours=1):
+                digest_at += timedelta(days=1) # Started well after today's digest; wait for tomorrow's
+            heap.append((max(digest_at, now), next(self._seq), _DIGEST, f"{_DIGEST}:{digest_at:%Y%m%d}", digest_at.date()))
+        heapq.heapify(heap)
+        with self._cond:
+            changes, self._changes_during_load = self._changes_during_load, None
+            self._heap = heap
+            self._booking_keys = booking_keys
+            for booking_id, start_at in changes: # Committed after the read above, or racing it
+                self._apply_change(booking_id, start_at)
+            self._done_keys &= {entry[3] for entry in self._heap}
+            self._done_keys -= released # Claimed here or elsewhere, never sent: due again
+            self._next_reload = now + RELOAD_INTERVAL
+            if oldest_pending is not None:
+                # A claim in flight may belong to a process that died; look again once its lease runs out
+                self._next_reload = min(self._next_reload, oldest_pending + CLAIM_LEASE + timedelta(seconds=1))
+
+    def _fetch_window(self, now, until):
+        return self.db.fetch_all(
+            "SELECT id, booking_date, start_time FROM bookings WHERE booking_date BETWEEN %s AND %s",
+            (now.date(), until.date())
+        )
+
+    def _booking_messages(self, due):
+        booking_ids = [payload for _, _, kind, _, payload in due if kind == _BOOKING]
+        if not booking_ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(booking_ids))
+        rows = self.db.fetch_all(f"""
+            SELECT b.id, b.booking_date, b.start_time, b.end_time, b.purpose, u.student_id, u.name
+            FROM bookings b JOIN users u ON b.user_id = u.id
+            WHERE b.id IN ({placeholders})
+        """, tuple(booking_ids))
+        messages = []
+        for row in rows:
+            key = _booking_key(row["id"], _start_at(row["booking_date"], row["start_time"]))
+            if not any(entry[3] == key for entry in due):
+                continue # Changed by another process since it was loaded; its new time has its own entry
+            messages.append({
+                "key": key, "kind": _BOOKING, "booking_id": row["id"], "recipients": [row["student_id"]],
+                "subject": "会议室预约提醒",
+                "body": f"{row['name']}，您预约的会议室将于 {row['booking_date']} "
+                        f"{_format_time(row['start_time'])}-{_format_time(row['end_time'])} 开始"
+                        f"（备注：{row['purpose'] or '无'}）。",
+            })
+        return messages
+
+    def _digest_messages(self, due):
+        messages = []
+        for _, _, kind, key, digest_date in due:
+            if kind != _DIGEST:
+                continue
+            admins = [row["student_id"] for row in self.db.fetch_all("SELECT student_id FROM users WHERE role = 'admin'")]
+            if not admins:
+                continue
+            rows = self.db.fetch_all("""
+                SELECT b.start_time, b.end_time, b.purpose, u.name, u.student_id
+                FROM bookings b JOIN users u ON b.user_id = u.id
+                WHERE b.booking_date = %s ORDER BY b.start_time
+            """, (digest_date,))
+            lines = [
+                f"{_format_time(r['start_time'])}-{_format_time(r['end_time'])} {r['name']} ({r['student_id']}) {r['purpose'] or ''}"
+                for r in rows
+            ]
+            messages.append({
+                "key": key, "kind": _DIGEST, "recipients": admins,
+                "subject": f"{digest_date} 会议室预约日报（共 {len(rows)} 条）",
+                "body": "\n".join(lines) or "当日暂无预约。",
+            })
+        return messages
+
+    def _claim(self, keys, token):
+        """Claims deliveries for this batch; returns the keys nobody had claimed before."""
+        placeholders = ", ".join(["%s"] * len(keys))
+        with self.db.transaction() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany(
+                    "INSERT IGNORE INTO reminder_deliveries (delivery_key, claimed_by) VALUES (%s, %s)",
+                    [(key, token) for key in keys]
+                )
+                cursor.execute(
+                    f"SELECT delivery_key FROM reminder_deliveries WHERE claimed_by = %s AND delivery_key IN ({placeholders})",
+                    (token, *keys)
+                )
+                return {row[0] for row in cursor.fetchall()}
+            finally:
+                cursor.close()
+
+    def _dispatch(self, due):
+        messages = self._booking_messages(due) + self._digest_messages(due)
+        if messages:
+            token = uuid.uuid4().hex # Per batch, so re-claiming a key this process sent before finds nothing
+            claimed = self._claim([m["key"] for m in messages], token)
+            messages = [m for m in messages if m["key"] in claimed]
+            sent = set()
+
+            def delivered(message):
+                self.db.execute(
+                    "UPDATE reminder_deliveries SET sent_at = NOW() WHERE delivery_key = %s AND claimed_by = %s",
+                    (message["key"], token)
+                )
+                sent.add(message["key"])
+
+            if messages:
+                try:
+                    self.sink.send(messages, delivered)
+                except Exception:
+                    # Delivered messages keep their claims; only the rest are released for the retry
+                    with self._cond:
+                        self._done_keys.update(sent)
+                    self.db.execute("DELETE FROM reminder_deliveries WHERE claimed_by = %s AND sent_at IS NULL", (token,))
+                    raise
+        with self._cond:
+            # Sent here, claimed by another process, or no longer valid: none needs another try
+            self._done_keys.update(entry[3] for entry in due)
+
+
+def create_reminder_scheduler(config, db_factory):
+    """Builds the ReminderScheduler described by `config["reminders"]`, or None if disabled.
+
+    `db_factory()` returns a Database; the scheduler gets its own pool, like the audit writer.
+    """
+    reminder_config = config.get("reminders", {})
+    if not reminder_config.get("enabled", False):
+        return None
+    sink_name = reminder_config.get("sink", "file")
+    if sink_name == "smtp":
+        sink = SmtpReminderSink(
+            reminder_config["smtp_host"], int(reminder_config.get("smtp_port", 587)), reminder_config["smtp_from"],
+            reminder_config["email_domain"], reminder_config.get("smtp_user"), reminder_config.get("smtp_password"),
+        )
+    elif sink_name == "webhook":
+        sink = WebhookReminderSink(reminder_config["webhook_url"])
+    elif sink_name == "memory":
+        sink = MemoryReminderSink()
+    else:
+        sink = FileReminderSink(reminder_config.get("file_path", "reminders.log"))
+    digest_time = reminder_config.get("digest_time")
+    return ReminderScheduler(
+        db_factory(), sink,
+        lead_minutes=int(reminder_config.get("lead_minutes", DEFAULT_LEAD_MINUTES)),
+        horizon_hours=int(reminder_config.get("horizon_hours", DEFAULT_HORIZON_HOURS)),
+        batch_size=int(reminder_config.get("batch_size", DEFAULT_BATCH_SIZE)),
+        digest_time=time.fromisoformat(digest_time) if digest_time else None,
+    )
+
+
+def booking_changed(db, booking_id, booking_date, start_time):
+    """Tells the scheduler attached to `db` about a new or changed booking; a no-op if none is attached."""
+    if db.reminders is not None:
+        db.reminders.booking_changed(booking_id, booking_date, start_time)
+
+
+def booking_removed(db, booking_id):
+    if db.reminders is not None:
+        db.reminders.booking_removed(booking_id)
@@ -0,0 +1,180 @@
+# services/schema.py
+"""Table definitions. `init_schema` is idempotent and safe to run on every start."""
+from services import occupancy, quotas
+
+_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        student_id VARCHAR(20) UNIQUE NOT NULL,
+        password_hash VARCHAR(255) NOT NULL,
+        name VARCHAR(100) NOT NULL,
+        role VARCHAR(10) NOT NULL DEFAULT 'user',
+        must_change_password_on_next_login BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS bookings (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        booking_date DATE NOT NULL,
+        start_time TIME NOT NULL,
+        end_time TIME NOT NULL,
+        attendees INT,
+        purpose TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+    # Removed bookings, so delta readers (the live booking board) can drop them.
+    # Pruned by `admin_cli.py prune-tombstones`.
+    """
+    CREATE TABLE IF NOT EXISTS booking_tombstones (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        booking_id INT NOT NULL,
+        booking_date DATE NOT NULL,
+        deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_tombstones_date_deleted (booking_date, deleted_at),
+        INDEX idx_tombstones_deleted (deleted_at)
+    )
+    """,
+    # Per-day bitmap of taken half-hour slots (see services/occupancy.py)
+    """
+    CREATE TABLE IF NOT EXISTS room_occupancy (
+        booking_date DATE PRIMARY KEY,
+        slot_mask BIGINT UNSIGNED NOT NULL DEFAULT 0
+    )
+    """,
+    # Per-user, per-day booking count and minutes for quota checks (see services/quotas.py)
+    """
+    CREATE TABLE IF NOT EXISTS booking_counters (
+        user_id INT NOT NULL,
+        booking_date DATE NOT NULL,
+        booking_count INT NOT NULL DEFAULT 0,
+        booked_minutes INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, booking_date),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+    # Requests waiting for a taken slot (see services/waitlist.py); promoted rows keep the booking id
+    """
+    CREATE TABLE IF NOT EXISTS booking_waitlist (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        booking_date DATE NOT NULL,
+        start_time TIME NOT NULL,
+        end_time TIME NOT NULL,
+        attendees INT,
+        purpose TEXT,
+        status VARCHAR(10) NOT NULL DEFAULT 'waiting',
+        booking_id INT NULL,
+        notified BOOLEAN NOT NULL DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        promoted_at TIMESTAMP NULL,
+        INDEX idx_waitlist_date_status (booking_date, status, id),
+        INDEX idx_waitlist_user_status (user_id, status),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+    # One row per reminder/digest delivery, claimed with INSERT IGNORE before sending (see services/reminders.py)
+    """
+    CREATE TABLE IF NOT EXISTS reminder_deliveries (
+        delivery_key VARCHAR(64) PRIMARY KEY,
+        claimed_by CHAR(32) NOT NULL,
+        claimed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        sent_at TIMESTAMP NULL,
+        INDEX idx_reminder_claimed_by (claimed_by),
+        INDEX idx_reminder_claimed_at (claimed_at)
+    )
+    """,
+    # Persistent login tokens (see services/sessions.py); revoked rows stay until they expire
+    """
+    CREATE TABLE IF NOT EXISTS session_tokens (
+        token_id CHAR(32) PRIMARY KEY,
+        user_id INT NOT NULL,
+        issued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        expires_at DATETIME NOT NULL,
+        revoked_at DATETIME NULL,
+        INDEX idx_session_tokens_expires (expires_at),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+    # Append-only; no foreign keys so entries outlive the users and bookings they mention
+    """
+    CREATE TABLE IF NOT EXISTS audit_log (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        occurred_at DATETIME(3) NOT NULL,
+        actor_id INT NULL,
+        source VARCHAR(10) NOT NULL,
+        action VARCHAR(40) NOT NULL,
+        target_type VARCHAR(20) NOT NULL,
+        target_id INT NULL,
+        details TEXT,
+        INDEX idx_audit_occurred (occurred_at),
+        INDEX idx_audit_action_occurred (action, occurred_at),
+        INDEX idx_audit_actor_occurred (actor_id, occurred_at)
+    )
+    """,
+]
+
+# Derived tables filled from existing data when they are first created
+_BACKFILLS = {
+    "room_occupancy": occupancy.rebuild_all,
+    "booking_counters": quotas.rebuild_all,
+}
+
+# (table, index name, column list) added to tables that predate them
+_INDEXES = [
+    ("bookings", "idx_bookings_date_updated", "booking_date, updated_at"),
+    ("users", "idx_users_name", "name"), # Name-prefix search; InnoDB appends id, giving (name, id) order
+]
+
+
+def _index_exists(cursor, table, index_name):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+        (table, index_name)
+    )
+    return cursor.fetchone() is not None
+
+
+def _ensure_index(cursor, table, index_name, columns):
+    # MySQL has no CREATE INDEX IF NOT EXISTS
+    if not _index_exists(cursor, table, index_name):
+        cursor.execute(f"CREATE INDEX {index_name} ON {table} ({columns})")
+
+
+def ensure_indexes(cursor):
+    for table, index_name, columns in _INDEXES:
+        _ensure_index(cursor, table, index_name, columns)
+
+
+def drop_secondary_indexes(cursor, tables):
+    """Drops the `_INDEXES` entries on `tables` before a bulk load; `ensure_indexes` puts them back.
+
+    Key, unique and foreign key indexes stay: they are constraints, not just access paths.
+    """
+    for table, index_name, _ in _INDEXES:
+        if table not in tables:
+            continue
+        if _index_exists(cursor, table, index_name):
+            cursor.execute(f"DROP INDEX {index_name} ON {table}")
+
+
+def init_schema(db):
+    # DDL commits implicitly in MySQL, so a plain connection is enough
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = DATABASE()")
+            existing_tables = {row[0].lower() for row in cursor.fetchall()}
+            for ddl in _TABLES:
+                cursor.execute(ddl)
+            ensure_indexes(cursor)
+        finally:
+            cursor.close()
+    for table, backfill in _BACKFILLS.items():
+        if table not in existing_tables:
+            backfill(db)
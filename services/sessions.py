@@ -0,0 +1,86 @@
+# services/sessions.py
+"""Signed, expiring session tokens, so a page refresh or reconnect does not need the password again.
+
+A token is `<token_id>.<user_id>.<expires>.<signature>`, the signature being an HMAC-SHA256
+of the first three parts under `[session] secret`. Checking a token is an HMAC comparison
+plus a primary-key lookup in `session_tokens` (cached by the caller) to see that it has not
+been revoked. Role changes, password changes and resets revoke every token of the user in
+the same transaction (see services/users.py); logout revokes the one token.
+
+Config (no secret means no persistent sessions):
+    [session]
+    secret = "long random string"
+    ttl_days = 7
+"""
+import base64
+import hashlib
+import hmac
+import secrets
+import time
+from datetime import datetime
+
+DEFAULT_TTL_DAYS = 7
+
+
+def _sign(secret, payload):
+    digest = hmac.new(secret.encode("utf-8"), payload.encode("ascii"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def session_settings(config):
+    """(secret, ttl_seconds), or None if persistent sessions are not configured."""
+    session_config = config.get("session", {})
+    secret = session_config.get("secret")
+    if not secret:
+        return None
+    return secret, int(float(session_config.get("ttl_days", DEFAULT_TTL_DAYS)) * 86400)
+
+
+def issue(db, secret, user_id, ttl_seconds):
+    token_id = secrets.token_hex(16)
+    expires = int(time.time()) + ttl_seconds
+    db.execute(
+        "INSERT INTO session_tokens (token_id, user_id, expires_at) VALUES (%s, %s, %s)",
+        (token_id, user_id, datetime.fromtimestamp(expires))
+    )
+    payload = f"{token_id}.{user_id}.{expires}"
+    return f"{payload}.{_sign(secret, payload)}"
+
+
+def parse(secret, token):
+    """(token_id, user_id, expires) if the signature matches and it has not expired, else None. No I/O.
+
+    The token comes from a browser cookie: anything malformed gives None rather than raising.
+    """
+    try:
+        token.encode("ascii") # Tokens are ASCII; also keeps _sign and the comparison below from raising
+        token_id, user_id, expires, signature = token.split(".")
+        user_id, expires = int(user_id), int(expires)
+    except (AttributeError, ValueError): # UnicodeEncodeError is a ValueError
+        return None
+    expected = _sign(secret, f"{token_id}.{user_id}.{expires}")
+    if not hmac.compare_digest(signature.encode("ascii"), expected.encode("ascii")):
+        return None
+    if expires <= time.time():
+        return None
+    return token_id, user_id, expires
+
+
+def is_active(db, token_id):
+    return db.fetch_named_one("session_active", (token_id,)) is not None
+
+
+def revoke(db, token_id):
+    db.execute("UPDATE session_tokens SET revoked_at = NOW() WHERE token_id = %s AND revoked_at IS NULL", (token_id,))
+
+
+def revoke_user_tokens(cursor, user_id):
+    """Revokes all of a user's tokens, inside the caller's transaction."""
+    cursor.execute(
+        "UPDATE session_tokens SET revoked_at = NOW() WHERE user_id = %s AND revoked_at IS NULL", (user_id,)
+    )
+
+
+def prune(db):
+    """Deletes expired tokens. Returns the number removed."""
+    return db.execute("DELETE FROM session_tokens WHERE expires_at < NOW()")
@@ -0,0 +1,164 @@
+# services/snapshot.py
+"""Columnar snapshots of `users` and `bookings`, for cloning data into staging or benchmarks.
+
+A snapshot is a directory with one file per table (`users.parquet`, `bookings.parquet`, or
+`.arrow` for the Arrow IPC file format). Export streams each table from one consistent read
+snapshot in `chunk_size` batches, so memory stays flat however large the table is. Restore
+loads into empty tables in multi-row `executemany` chunks with foreign key and unique checks
+off and the secondary indexes dropped, rebuilds those indexes once at the end, and then
+rebuilds the derived tables (occupancy bitmap, quota counters). Ids are kept, so bookings
+stay attached to their users.
+"""
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from services import audit, occupancy, quotas, schema
+from services.errors import ServiceError
+
+DEFAULT_CHUNK_SIZE = 20000
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+# Restore order matters: users before the bookings that reference them
+_SNAPSHOT_TABLES = [
+    ("users", pa.schema([
+        ("id", pa.int32()),
+        ("student_id", pa.string()),
+        ("password_hash", pa.string()),
+        ("name", pa.string()),
+        ("role", pa.string()),
+        ("must_change_password_on_next_login", pa.bool_()),
+        ("created_at", pa.timestamp("s")),
+    ])),
+    ("bookings", pa.schema([
+        ("id", pa.int32()),
+        ("user_id", pa.int32()),
+        ("booking_date", pa.date32()),
+        ("start_time", pa.time32("s")),
+        ("end_time", pa.time32("s")),
+        ("attendees", pa.int32()),
+        ("purpose", pa.string()),
+        ("created_at", pa.timestamp("s")),
+        ("updated_at", pa.timestamp("s")),
+    ])),
+]
+
+
+def _to_batch(rows, arrow_schema):
+    arrays = []
+    for field, values in zip(arrow_schema, zip(*rows)):
+        if pa.types.is_time(field.type): # MySQL returns TIME as timedelta
+            values = [None if v is None else occupancy.time_to_seconds(v) for v in values]
+        elif pa.types.is_boolean(field.type): # BOOLEAN is TINYINT(1)
+            values = [None if v is None else bool(v) for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=arrow_schema)
+
+
+def _open_writer(path, arrow_schema, fmt):
+    if fmt == "parquet":
+        return pq.ParquetWriter(path, arrow_schema, compression="zstd")
+    return pa.ipc.new_file(path, arrow_schema)
+
+
+def _read_batches(path, chunk_size):
+    if path.endswith(FORMATS["parquet"]):
+        yield from pq.ParquetFile(path).iter_batches(batch_size=chunk_size)
+        return
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches): # Written chunk_size rows at a time by export
+            yield reader.get_batch(i)
+
+
+def _snapshot_file(directory, table):
+    for extension in FORMATS.values():
+        path = os.path.join(directory, table + extension)
+        if os.path.exists(path):
+            return path
+    raise ServiceError(f"no {table}.parquet or {table}.arrow in {directory}")
+
+
+def export_snapshot(db, directory, fmt="parquet", chunk_size=DEFAULT_CHUNK_SIZE):
+    """Writes every table in the snapshot to `directory`; returns {table: row count}."""
+    if fmt not in FORMATS:
+        raise ServiceError(f"unknown snapshot format {fmt!r}")
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    with db.connection() as conn:
+        # One read snapshot for all tables, so no booking points at a user missing from the export
+        conn.start_transaction(consistent_snapshot=True, readonly=True)
+        try:
+            for table, arrow_schema in _SNAPSHOT_TABLES:
+                cursor = conn.cursor() # Unbuffered: rows stream in as fetchmany asks for them
+                writer = _open_writer(os.path.join(directory, table + FORMATS[fmt]), arrow_schema, fmt)
+                try:
+                    cursor.execute(f"SELECT {', '.join(arrow_schema.names)} FROM {table} ORDER BY id")
+                    counts[table] = 0
+                    while True:
+                        rows = cursor.fetchmany(chunk_size)
+                        if not rows:
+                            break
+                        writer.write_batch(_to_batch(rows, arrow_schema))
+                        counts[table] += len(rows)
+                finally:
+                    writer.close()
+                    cursor.close()
+        finally:
+            conn.rollback() # Read-only; just ends the snapshot
+    return counts
+
+
+def _load_table(conn, cursor, table, columns, path, chunk_size):
+    insert = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    loaded = 0
+    for batch in _read_batches(path, chunk_size):
+        missing = set(columns) - set(batch.schema.names)
+        if missing:
+            raise ServiceError(f"{path} is missing column(s) {', '.join(sorted(missing))}")
+        rows = list(zip(*(batch.column(name).to_pylist() for name in columns)))
+        conn.start_transaction()
+        try:
+            cursor.executemany(insert, rows) # The connector sends one multi-row INSERT per chunk
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        loaded += len(rows)
+    return loaded
+
+
+def restore_snapshot(db, directory, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Loads a snapshot into empty `users` and `bookings` tables; returns {table: row count}.
+
+    If it fails halfway, empty the tables and run it again; the dropped indexes come back
+    with the next `init_schema` even if it is not re-run.
+    """
+    paths = {table: _snapshot_file(directory, table) for table, _ in _SNAPSHOT_TABLES}
+    tables = [table for table, _ in _SNAPSHOT_TABLES]
+    schema.init_schema(db)
+    counts = {}
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            for table in tables:
+                cursor.execute(f"SELECT 1 FROM {table} LIMIT 1")
+                if cursor.fetchone() is not None:
+                    raise ServiceError(f"table {table} is not empty; restore only loads into an empty database")
+            # Session settings go back on the pooled connection, so they are reset in finally
+            cursor.execute("SET SESSION foreign_key_checks = 0, unique_checks = 0")
+            try:
+                schema.drop_secondary_indexes(cursor, tables)
+                for table, arrow_schema in _SNAPSHOT_TABLES:
+                    counts[table] = _load_table(conn, cursor, table, arrow_schema.names, paths[table], chunk_size)
+                schema.ensure_indexes(cursor) # One sorted build per index instead of per-row maintenance
+            finally:
+                cursor.execute("SET SESSION foreign_key_checks = 1, unique_checks = 1")
+        finally:
+            cursor.close()
+    db.mark_write()
+    occupancy.rebuild_all(db)
+    quotas.rebuild_all(db)
+    audit.record(db, "snapshot.restore", "snapshot", None, source="cli", directory=os.path.abspath(directory), **counts)
+    return counts
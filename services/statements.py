@@ -0,0 +1,80 @@
+# services/statements.py
+"""Registry of the hot read queries, run as server-side prepared statements.
+
+Each statement is prepared the first time it runs on a pooled connection and then kept
+(one prepared cursor per statement per connection), so later calls skip parsing on both
+ends and exchange parameters and rows in the binary protocol. Statements are plain module
+constants because the connector decides whether to re-prepare by object identity: the same
+string object must come back every time. Variants are separate entries rather than SQL
+assembled per call.
+
+Run them with `Database.fetch_named(name, params)`, or `run(conn, name, params)` on a
+connection the caller already holds (e.g. inside a transaction).
+"""
+_BOOKING_VIEW_COLUMNS = "b.id, b.start_time, b.end_time, u.name as user_name, u.student_id, b.attendees, b.purpose"
+USER_LIST_COLUMNS = "id, student_id, name, role, must_change_password_on_next_login"
+
+_BOOKINGS_FROM_DATE = """
+    SELECT b.id, b.booking_date, b.start_time, b.end_time, u.name as user_name, u.student_id, b.attendees, b.purpose
+    FROM bookings b JOIN users u ON b.user_id = u.id
+    WHERE b.booking_date >= %s{user_filter}
+    ORDER BY b.booking_date DESC, b.start_time ASC
+"""
+
+_CONFLICTS = """
+    SELECT b.id, u.name as user_name, u.student_id, b.start_time, b.end_time, b.purpose
+    FROM bookings b JOIN users u ON b.user_id = u.id
+    WHERE b.booking_date = %s AND (%s < b.end_time AND %s > b.start_time){exclude}
+"""
+
+STATEMENTS = {
+    "bookings_for_date": f"""
+        SELECT {_BOOKING_VIEW_COLUMNS}, b.updated_at
+        FROM bookings b JOIN users u ON b.user_id = u.id
+        WHERE b.booking_date = %s ORDER BY b.start_time
+    """,
+    "booking_changes": f"""
+        SELECT 'upsert' AS change_type, {_BOOKING_VIEW_COLUMNS}, b.updated_at AS changed_at
+        FROM bookings b JOIN users u ON b.user_id = u.id
+        WHERE b.booking_date = %s AND b.updated_at >= %s
+        UNION ALL
+        SELECT 'delete', t.booking_id, NULL, NULL, NULL, NULL, NULL, NULL, t.deleted_at
+        FROM booking_tombstones t
+        WHERE t.booking_date = %s AND t.deleted_at >= %s
+    """,
+    "bookings_from_date": _BOOKINGS_FROM_DATE.format(user_filter=""),
+    "bookings_from_date_for_user": _BOOKINGS_FROM_DATE.format(user_filter=" AND b.user_id = %s"),
+    "conflicts": _CONFLICTS.format(exclude=""),
+    "conflicts_excluding": _CONFLICTS.format(exclude=" AND b.id != %s"),
+    "day_mask": "SELECT slot_mask FROM room_occupancy WHERE booking_date = %s",
+    "user_by_student_id": "SELECT * FROM users WHERE student_id = %s",
+    "user_password_hash": "SELECT password_hash FROM users WHERE id = %s",
+    "user_profile": f"SELECT {USER_LIST_COLUMNS} FROM users WHERE id = %s",
+    "session_active": (
+        "SELECT 1 AS active FROM session_tokens WHERE token_id = %s AND revoked_at IS NULL AND expires_at > NOW()"
+    ),
+}
+
+_CURSORS_ATTR = "_rfa_prepared_cursors" # Per-connection {name: prepared cursor}
+
+
+def run(conn, name, params=()):
+    """Executes a registered statement on `conn`, preparing it on first use; returns a list of dicts."""
+    cursors = getattr(conn, _CURSORS_ATTR, None)
+    if cursors is None:
+        cursors = {}
+        setattr(conn, _CURSORS_ATTR, cursors) # Lives and dies with the connection (and its server session)
+    cursor = cursors.get(name)
+    if cursor is None:
+        cursor = cursors[name] = conn.cursor(prepared=True, dictionary=True)
+    try:
+        cursor.execute(STATEMENTS[name], params)
+        return cursor.fetchall()
+    except BaseException:
+        # Drop the cursor so the next call prepares afresh instead of reusing a half-read one
+        del cursors[name]
+        try:
+            cursor.close()
+        except Exception:
+            pass
+        raise
@@ -0,0 +1,163 @@
+# services/users.py
+"""User queries and mutations. Every function takes a `services.db.Database` first.
+
+Role and password changes revoke the user's session tokens in the same transaction.
+"""
+from werkzeug.security import generate_password_hash
+
+from services import audit, occupancy, sessions
+from services.errors import DataAccessError, DuplicateStudentIdError
+from services.statements import USER_LIST_COLUMNS as _USER_LIST_COLUMNS
+
+_ER_DUP_ENTRY = 1062
+USER_SEARCH_PAGE_SIZE = 20
+
+
+def get_user_by_student_id(db, student_id):
+    return db.fetch_named_one("user_by_student_id", (student_id,))
+
+
+def get_user_by_id(db, user_id): # Primarily for fetching password_hash
+    return db.fetch_named_one("user_password_hash", (user_id,))
+
+
+def get_user_profile(db, user_id):
+    """Everything the admin page shows for one user (no password hash)."""
+    return db.fetch_named_one("user_profile", (user_id,))
+
+
+def _like_prefix(prefix):
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+def search_users(db, prefix="", by="student_id", after=None, limit=USER_SEARCH_PAGE_SIZE):
+    """One page of users whose student ID (by="student_id") or name (by="name") starts with `prefix`.
+
+    Keyset pagination in index order: `after` is the sort key of the previous page's last
+    row - the student_id, or a (name, id) pair - so every page is an index range scan of
+    `limit` rows however deep it is. Returns (rows, next_after); next_after is None on the
+    last page.
+    """
+    params = [_like_prefix(prefix)]
+    if by == "student_id":
+        query = f"SELECT {_USER_LIST_COLUMNS} FROM users WHERE student_id LIKE %s"
+        if after is not None:
+            query += " AND student_id > %s"
+            params.append(after)
+        query += " ORDER BY student_id LIMIT %s"
+    elif by == "name":
+        query = f"SELECT {_USER_LIST_COLUMNS} FROM users WHERE name LIKE %s"
+        if after is not None:
+            query += " AND (name > %s OR (name = %s AND id > %s))"
+            params.extend([after[0], after[0], after[1]])
+        query += " ORDER BY name, id LIMIT %s"
+    else:
+        raise ValueError(f"unknown search field {by!r}")
+    params.append(limit + 1) # One extra row tells whether there is a next page
+    rows = db.fetch_all(query, tuple(params), routed=True)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, (last["student_id"] if by == "student_id" else (last["name"], last["id"]))
+
+
+def add_user(db, student_id, name, password_hash, role, actor_id=None):
+    try:
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    "INSERT INTO users (student_id, name, password_hash, role, must_change_password_on_next_login) VALUES (%s, %s, %s, %s, TRUE)",
+                    (student_id, name, password_hash, role)
+                )
+                user_id = cursor.lastrowid
+            finally:
+                cursor.close()
+    except DataAccessError as e:
+        if e.errno == _ER_DUP_ENTRY:
+            raise DuplicateStudentIdError(student_id) from e
+        raise
+    audit.record(db, "user.create", "user", user_id, actor_id, student_id=student_id, name=name, role=role)
+    return user_id
+
+
+def add_users_bulk(db, users):
+    """Inserts (student_id, name, password_hash, role) tuples in one multi-row INSERT.
+
+    Existing student IDs are skipped. Returns the number of rows inserted.
+    """
+    with db.transaction() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(
+                "INSERT IGNORE INTO users (student_id, name, password_hash, role, must_change_password_on_next_login) VALUES (%s, %s, %s, %s, TRUE)",
+                list(users)
+            )
+            inserted = cursor.rowcount
+        finally:
+            cursor.close()
+    audit.record(db, "user.bulk_insert", "user", None, source="cli", inserted=inserted)
+    return inserted
+
+
+def delete_user(db, user_id, actor_id=None):
+    with db.transaction() as conn:
+        cursor = conn.cursor()
+        try:
+            # The FK cascade removes the user's bookings; record them for delta readers first
+            cursor.execute("SELECT DISTINCT booking_date FROM bookings WHERE user_id = %s", (user_id,))
+            booking_dates = [row[0] for row in cursor.fetchall()]
+            cursor.execute("""
+                INSERT INTO booking_tombstones (booking_id, booking_date)
+                SELECT id, booking_date FROM bookings WHERE user_id = %s
+            """, (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            for booking_date in booking_dates:
+                occupancy.recompute_day(cursor, booking_date)
+        finally:
+            cursor.close()
+    audit.record(db, "user.delete", "user", user_id, actor_id, booking_dates=booking_dates)
+
+
+def _update_and_revoke_sessions(db, query, params, user_id):
+    with db.transaction() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            sessions.revoke_user_tokens(cursor, user_id)
+        finally:
+            cursor.close()
+
+
+def update_user_role(db, user_id, new_role, actor_id=None):
+    _update_and_revoke_sessions(db, "UPDATE users SET role = %s WHERE id = %s", (new_role, user_id), user_id)
+    audit.record(db, "user.role_change", "user", user_id, actor_id, new_role=new_role)
+
+
+def update_user_password(db, user_id, new_password_hash, actor_id=None):
+    _update_and_revoke_sessions(
+        db, "UPDATE users SET password_hash = %s, must_change_password_on_next_login = FALSE WHERE id = %s",
+        (new_password_hash, user_id), user_id
+    )
+    audit.record(db, "user.password_change", "user", user_id, actor_id)
+
+
+def reset_user_password(db, user_id, new_password_hash, actor_id=None):
+    _update_and_revoke_sessions(
+        db, "UPDATE users SET password_hash = %s, must_change_password_on_next_login = TRUE WHERE id = %s",
+        (new_password_hash, user_id), user_id
+    )
+    audit.record(db, "user.password_reset", "user", user_id, actor_id)
+
+
+def ensure_initial_admin(db, student_id, password, name):
+    """Creates the admin account if it does not exist yet. Returns True if it was created."""
+    if db.fetch_one("SELECT id FROM users WHERE student_id = %s AND role = 'admin'", (student_id,)):
+        return False
+    db.execute(
+        "INSERT INTO users (student_id, password_hash, name, role) VALUES (%s, %s, %s, 'admin')",
+        (student_id, generate_password_hash(password), name)
+    )
+    return True
@@ -0,0 +1,105 @@
+# services/waitlist.py
+"""Waitlist for taken time slots.
+
+A user whose requested time is taken can join the waitlist for it instead of resubmitting
+the form until it frees up. Whenever `bookings.delete_booking` or `bookings.update_booking`
+frees time on a date, the same transaction walks that date's waiting entries oldest first
+(a range on the (booking_date, status, id) index) and books each one that now fits and is
+within its user's quota. Nothing scans on a timer. A promoted entry keeps the id of the
+booking made for it until its user has been shown the result (`pending_promotions`).
+"""
+from services import occupancy, statements
+from services.errors import SlotAvailableError
+
+WAITING = "waiting"
+PROMOTED = "promoted"
+
+
+def join(db, user_id, booking_date, start_time, end_time, attendees, purpose):
+    """Adds a waiting entry and returns its id; joining the same slot twice returns the existing entry.
+
+    Runs under the day's occupancy lock and checks the time again: if it was freed (and the
+    promotion pass for that write already ran) since the user saw the conflict, an entry
+    added now would wait until some later write on the date. Raises SlotAvailableError then.
+    """
+    with db.transaction() as conn:
+        cursor = conn.cursor()
+        try:
+            day_mask = occupancy.lock_day(cursor, booking_date)
+            if not (day_mask & occupancy.slot_mask(start_time, end_time)
+                    and statements.run(conn, "conflicts", (booking_date, start_time, end_time))):
+                raise SlotAvailableError()
+            cursor.execute("""
+                SELECT id FROM booking_waitlist
+                WHERE user_id = %s AND booking_date = %s AND start_time = %s AND end_time = %s AND status = %s
+            """, (user_id, booking_date, start_time, end_time, WAITING))
+            existing = cursor.fetchone()
+            if existing:
+                return existing[0]
+            cursor.execute("""
+                INSERT INTO booking_waitlist (user_id, booking_date, start_time, end_time, attendees, purpose)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (user_id, booking_date, start_time, end_time, attendees, purpose))
+            return cursor.lastrowid
+        finally:
+            cursor.close()
+
+
+def leave(db, entry_id, user_id):
+    """Removes one of the user's waiting entries. Returns False if it was promoted or is gone."""
+    return db.execute(
+        "DELETE FROM booking_waitlist WHERE id = %s AND user_id = %s AND status = %s", (entry_id, user_id, WAITING)
+    ) > 0
+
+
+def get_waiting_entries(db, user_id, now):
+    """The user's waiting entries that have not started by `now`. Started ones are never promoted
+    (see bookings._promote_waiters) and stay in the table, so they are left out here."""
+    return db.fetch_all("""
+        SELECT id, booking_date, start_time, end_time, attendees, purpose, created_at
+        FROM booking_waitlist
+        WHERE user_id = %s AND status = %s
+          AND (booking_date > %s OR (booking_date = %s AND start_time > %s))
+        ORDER BY booking_date, start_time
+    """, (user_id, WAITING, now.date(), now.date(), now.time()))
+
+
+def pending_promotions(db, user_id):
+    """Promotions the user has not been shown yet. Read from the primary: they are seconds old."""
+    return db.fetch_all("""
+        SELECT id, booking_id, booking_date, start_time, end_time
+        FROM booking_waitlist
+        WHERE user_id = %s AND status = %s AND notified = FALSE
+        ORDER BY promoted_at
+    """, (user_id, PROMOTED))
+
+
+def acknowledge_promotions(db, user_id, entry_ids):
+    if not entry_ids:
+        return 0
+    placeholders = ", ".join(["%s"] * len(entry_ids))
+    return db.execute(
+        f"UPDATE booking_waitlist SET notified = TRUE WHERE user_id = %s AND id IN ({placeholders})",
+        (user_id, *entry_ids)
+    )
+
+
+# --- Called with a cursor inside the caller's transaction ---
+def lock_waiting(cursor, booking_date):
+    """Row-locks the date's waiting entries and returns them oldest first as
+    (id, user_id, start_time, end_time, attendees, purpose)."""
+    cursor.execute("""
+        SELECT id, user_id, start_time, end_time, attendees, purpose
+        FROM booking_waitlist
+        WHERE booking_date = %s AND status = %s
+        ORDER BY id
+        FOR UPDATE
+    """, (booking_date, WAITING))
+    return cursor.fetchall()
+
+
+def mark_promoted(cursor, entry_id, booking_id):
+    cursor.execute(
+        "UPDATE booking_waitlist SET status = %s, booking_id = %s, promoted_at = NOW() WHERE id = %s",
+        (PROMOTED, booking_id, entry_id)
+    )
@@ -0,0 +1,74 @@
+# services/warmup.py
+"""Background cache warming: runs loader calls on a small thread pool, off the request path.
+
+Loads are keyed; submitting a key that is already queued returns the queued future instead
+of adding a second copy, so a burst of writes or logins collapses into one load per key.
+A key stops counting as queued once its load starts: a load that began before a write
+committed may read old data, so a refresh submitted after the write must still run. At
+most `max_pending` loads wait in the queue; beyond that new ones are dropped (warming is an
+optimisation, the page will load the data itself).
+`start_daily` runs a job just after every local midnight, when the bookable window moves.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_MAX_PENDING = 64
+
+
+class CacheWarmer:
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_pending=DEFAULT_MAX_PENDING):
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="cache-warmer")
+        self._max_pending = max_pending
+        self._queued = {} # key -> Future of a load that has not started yet
+        self._lock = threading.Lock()
+        self._daily_started = False
+
+    def submit(self, key, fn, *args):
+        """Runs fn(*args) in the background unless a load for `key` is already queued.
+
+        Returns the queued Future, or None if the queue is full.
+        """
+        with self._lock:
+            future = self._queued.get(key)
+            if future is not None:
+                return future
+            if len(self._queued) >= self._max_pending:
+                return None
+            # Registered under the lock, so _run cannot remove the key before it is added
+            future = self._queued[key] = self._executor.submit(self._run, key, fn, args)
+            return future
+
+    def _run(self, key, fn, args):
+        with self._lock:
+            self._queued.pop(key, None)
+        try:
+            fn(*args)
+        except Exception:
+            logger.exception("cache warm-up %r failed", key)
+
+    def start_daily(self, job):
+        """Calls job() shortly after every local midnight, on a daemon thread. Only the first call starts one."""
+        with self._lock:
+            if self._daily_started:
+                return
+            self._daily_started = True
+        threading.Thread(target=self._daily_loop, args=(job,), name="cache-warmer-daily", daemon=True).start()
+
+    def _daily_loop(self, job):
+        while True:
+            now = datetime.now()
+            next_midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+            time.sleep((next_midnight - now).total_seconds() + 1)
+            try:
+                job()
+            except Exception:
+                logger.exception("daily cache warm-up failed")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,39 @@
+# tests/test_sessions.py
+import time
+
+import pytest
+
+from services import sessions
+
+SECRET = "test-secret"
+
+
+def _token(token_id="abc", user_id=1, expires=None):
+    expires = expires or int(time.time()) + 3600
+    payload = f"{token_id}.{user_id}.{expires}"
+    return f"{payload}.{sessions._sign(SECRET, payload)}"
+
+
+def test_parse_accepts_valid_token():
+    token = _token()
+    token_id, user_id, _ = sessions.parse(SECRET, token)
+    assert (token_id, user_id) == ("abc", 1)
+
+
+@pytest.mark.parametrize("token", [
+    None,
+    "",
+    "a.b.c",
+    "a.1.99999999999.é",
+    "é.1.99999999999.b",
+    "a.x.99999999999.b",
+    "a.1.99999999999.b.c",
+    _token().replace("abc.1.", "abc.2.", 1), # Signature made for another user
+    _token(expires=int(time.time()) - 1),
+])
+def test_parse_rejects_malformed_tokens(token):
+    assert sessions.parse(SECRET, token) is None
+
+
+def test_parse_rejects_other_secret():
+    assert sessions.parse("other-secret", _token()) is None
@@ -0,0 +1,57 @@
+# ui_pages/audit_log.py
+import streamlit as st
+import pandas as pd
+from datetime import date, datetime, time, timedelta
+from database_utils import get_audit_log, query_audit_events_db
+from services.audit import DatabaseAuditSink
+
+AUDIT_ACTIONS = {
+    "": "全部操作",
+    "booking.create": "创建预约", "booking.update": "修改预约", "booking.delete": "删除预约",
+    "booking.bulk_cancel": "批量取消预约", "booking.bulk_insert": "批量导入预约",
+    "user.create": "添加用户", "user.delete": "删除用户", "user.role_change": "修改角色",
+    "user.password_reset": "重置密码", "user.password_change": "修改密码", "user.bulk_insert": "批量导入用户",
+    "waitlist.promote": "候补转正", "snapshot.restore": "导入数据快照",
+}
+
+def show_audit_log_page(): # Admin only
+    st.subheader("操作审计日志")
+
+    audit_log = get_audit_log()
+    if audit_log.dropped:
+        st.warning(f"审计队列曾满，已丢弃 {audit_log.dropped} 条事件（本进程）。")
+    if not isinstance(audit_log.sink, DatabaseAuditSink):
+        st.info(f"审计日志写入本地文件：{audit_log.sink.path}，请在服务器上查看。")
+        return
+
+    filter_cols = st.columns([0.4, 0.3, 0.3])
+    with filter_cols[0]:
+        date_range = st.date_input(
+            "日期范围", value=(date.today() - timedelta(days=6), date.today()), key="audit_date_range"
+        )
+    with filter_cols[1]:
+        action = st.selectbox(
+            "操作类型", options=list(AUDIT_ACTIONS.keys()), format_func=lambda x: AUDIT_ACTIONS[x], key="audit_action"
+        )
+    with filter_cols[2]:
+        actor_student_id = st.text_input("操作人学号", key="audit_actor_sid").strip()
+
+    if not isinstance(date_range, tuple) or len(date_range) != 2:
+        st.info("请选择开始和结束日期。")
+        return
+    start = datetime.combine(date_range[0], time.min)
+    end = datetime.combine(date_range[1] + timedelta(days=1), time.min)
+
+    events = query_audit_events_db(start, end, action or None, actor_student_id or None)
+    st.caption("最近的事件在前，最多显示 200 条。事件为异步写入，可能有几秒延迟。")
+    if events:
+        df_events = pd.DataFrame(events)
+        df_events['action'] = df_events['action'].map(lambda a: AUDIT_ACTIONS.get(a, a))
+        df_events_display = df_events.rename(columns={
+            'occurred_at': '时间', 'action': '操作', 'target_type': '对象类型', 'target_id': '对象ID',
+            'actor_name': '操作人', 'actor_student_id': '操作人学号', 'source': '来源', 'details': '详情'
+        })
+        display_cols = ['时间', '操作', '对象类型', '对象ID', '操作人', '操作人学号', '来源', '详情']
+        st.dataframe(df_events_display[display_cols], hide_index=True, use_container_width=True)
+    else:
+        st.info("所选条件下没有审计事件。")
@@ -2,31 +2,33 @@
 import streamlit as st
 import pandas as pd
 from datetime import date, time, timedelta, datetime # Ensure datetime is imported
-from database_utils import check_booking_conflict_db, create_booking_db, get_bookings_for_date_db
+from database_utils import (
+    check_booking_conflict_db, create_booking_db, get_bookings_for_date_db, get_booking_changes_db, join_waitlist_db
+)
+from services.bookings import TOMBSTONE_RETENTION
+from services.day_board import DayBoard
+from services.occupancy import free_ranges, mask_for_bookings
 
-def show_booking_page():
-    st.subheader("预约会议室") # Main title for the page
-    today = date.today()
-    
-    # Date range settings for the main date picker
-    # Users can only select today or future dates, up to one week in advance.
-    min_selectable_date = today
-    max_selectable_date = today + timedelta(days=6)  # Can book up to one week (today + 6 days)
+BOARD_REFRESH_SECONDS = 5 # How often each open tab asks for changes to the shown day
 
-    # --- 1. Date Picker ---
-    selected_display_date = st.date_input(
-        "选择日期查看预约情况或进行新的预约", # Combined label
-        min_value=min_selectable_date,
-        max_value=max_selectable_date,
-        value=min_selectable_date,        # Default to today
-        key="booking_page_date_selector_v4" # Ensure unique key
-    )
-    
-    st.markdown("---") # Separator
+@st.fragment(run_every=BOARD_REFRESH_SECONDS)
+def show_day_board(selected_display_date):
+    # Only this fragment reruns on the timer. The first run for a date starts from the (shared,
+    # cached) full day listing; every tick after that fetches just the rows changed since the
+    # board's watermark, plus tombstones for removed bookings, and patches the board in place.
+    board = st.session_state.get("booking_day_board")
+    last_polled_at = st.session_state.get("booking_day_board_polled_at")
+    now = datetime.now()
+    if (board is None or board.booking_date != selected_display_date
+            or last_polled_at is None or now - last_polled_at > TOMBSTONE_RETENTION):
+        # A tab that slept longer than tombstones are kept could miss deletions; start over
+        board = DayBoard(selected_display_date, get_bookings_for_date_db(selected_display_date))
+    else:
+        board.apply(get_booking_changes_db(selected_display_date, board.watermark))
+    st.session_state.booking_day_board = board
+    st.session_state.booking_day_board_polled_at = now
 
-    # --- 2. Daily Summary for the Selected Date ---
-    st.subheader(f"{selected_display_date.strftime('%Y-%m-%d')} 当日预约情况：")
-    day_bookings = get_bookings_for_date_db(selected_display_date)
+    day_bookings = board.rows()
     if day_bookings:
         df_day_bookings = pd.DataFrame(day_bookings)
         
@@ -53,6 +55,37 @@ def show_booking_page():
         st.dataframe(df_display_summary[display_summary_cols], hide_index=True, use_container_width=True)
     else:
         st.info(f"当日（{selected_display_date.strftime('%Y-%m-%d')}）暂无预约。")
+
+    # Free time straight from the half-hour occupancy bitmap of the board's rows
+    free_text = "、".join(
+        f"{start.strftime('%H:%M')}-{'24:00' if end == time.max else end.strftime('%H:%M')}"
+        for start, end in free_ranges(mask_for_bookings(day_bookings))
+    )
+    st.caption(f"空闲时段：{free_text or '无'}")
+
+def show_booking_page():
+    st.subheader("预约会议室") # Main title for the page
+    today = date.today()
+    
+    # Date range settings for the main date picker
+    # Users can only select today or future dates, up to one week in advance.
+    min_selectable_date = today
+    max_selectable_date = today + timedelta(days=6)  # Can book up to one week (today + 6 days)
+
+    # --- 1. Date Picker ---
+    selected_display_date = st.date_input(
+        "选择日期查看预约情况或进行新的预约", # Combined label
+        min_value=min_selectable_date,
+        max_value=max_selectable_date,
+        value=min_selectable_date,        # Default to today
+        key="booking_page_date_selector_v4" # Ensure unique key
+    )
+    
+    st.markdown("---") # Separator
+
+    # --- 2. Daily Summary for the Selected Date ---
+    st.subheader(f"{selected_display_date.strftime('%Y-%m-%d')} 当日预约情况：")
+    show_day_board(selected_display_date) # Refreshes itself every BOARD_REFRESH_SECONDS
     
     st.markdown("---") # Separator
 
@@ -99,10 +132,15 @@ def show_booking_page():
                             cb_start_str = cb['start_time'].strftime('%H:%M') if isinstance(cb['start_time'], time) else str(cb['start_time'])
                             cb_end_str = cb['end_time'].strftime('%H:%M') if isinstance(cb['end_time'], time) else str(cb['end_time'])
                             st.error(f"- {cb_start_str} 至 {cb_end_str} (预约人: {cb['user_name']}, 学号: {cb['student_id']})")
+                        # Offered below the form (buttons cannot live inside it)
+                        st.session_state.booking_waitlist_candidate = (
+                            selected_display_date, start_time_dt, end_time_dt, attendees, purpose
+                        )
                 else: 
                     if 'user_id' not in st.session_state:
                         st.error("无法获取用户信息，请重新登录后再试。")
                     elif create_booking_db(st.session_state.user_id, selected_display_date, start_time_dt, end_time_dt, attendees, purpose):
+                        st.session_state.pop("booking_waitlist_candidate", None)
                         st.success(
                             f"会议室于 {selected_display_date.strftime('%Y-%m-%d')} "
                             f"{start_time_dt.strftime('%H:%M')} - {end_time_dt.strftime('%H:%M')} "
@@ -110,4 +148,17 @@ def show_booking_page():
                         )
                         st.rerun() 
                     else:
-                        st.error("预约未能成功保存，请检查输入或稍后再试。")
\ No newline at end of file
+                        st.error("预约未能成功保存，请检查输入或稍后再试。")
+
+    # --- 4. Waitlist for the slot that just conflicted ---
+    candidate = st.session_state.get("booking_waitlist_candidate")
+    if candidate and candidate[0] == selected_display_date:
+        _, wl_start, wl_end, wl_attendees, wl_purpose = candidate
+        st.info(
+            f"可以加入 {wl_start.strftime('%H:%M')} - {wl_end.strftime('%H:%M')} 的候补队列："
+            "该时段空出时将按加入顺序自动为您预约，结果在您下次打开页面时显示。"
+        )
+        if st.button("加入候补", key="join_waitlist_btn"):
+            if join_waitlist_db(st.session_state.user_id, selected_display_date, wl_start, wl_end, wl_attendees, wl_purpose):
+                st.session_state.pop("booking_waitlist_candidate", None)
+                st.success("已加入候补队列，可在“我的预约记录”中查看或取消。")
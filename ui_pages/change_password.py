@@ -1,7 +1,7 @@
 # ui_pages/change_password.py
 import streamlit as st
 from database_utils import get_user_by_id_db, update_user_password_db
-from auth_utils import verify_password, hash_password
+from auth_utils import verify_password, hash_password, remember_session
 
 def show_change_password_page():
     st.subheader("修改密码")
@@ -31,6 +31,7 @@ def show_change_password_page():
                         new_hashed_pass = hash_password(new_pass)
                         if update_user_password_db(user_id, new_hashed_pass):
                             st.session_state.force_password_change = False
+                            remember_session(user_id) # The change revoked every token, this session's included
                             st.success("密码修改成功！")
                             # Optional: redirect or clear form
                             # st.rerun() # Rerun to reflect change and potentially update navigation
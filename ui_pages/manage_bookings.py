@@ -6,7 +6,9 @@ from database_utils import (
     get_bookings_filtered_db, 
     delete_booking_db, 
     update_booking_db,
-    check_booking_conflict_db
+    check_booking_conflict_db,
+    get_waiting_entries_db,
+    leave_waitlist_db
 )
 from utils import convert_db_time_to_datetime_time
 
@@ -141,4 +143,24 @@ def show_manage_bookings_page(show_all=False):
                                     else:
                                         st.error("修改预约时发生数据库错误。")
     else:
-        st.info("没有未来的或今日未完成的预约记录。")
\ No newline at end of file
+        st.info("没有未来的或今日未完成的预约记录。")
+
+    if not show_all:
+        show_my_waitlist(user_id_to_filter)
+
+def show_my_waitlist(user_id):
+    waiting_entries = get_waiting_entries_db(user_id, datetime.now())
+    if not waiting_entries:
+        return
+    st.markdown("---")
+    st.subheader("我的候补")
+    for entry in waiting_entries:
+        start_str = convert_db_time_to_datetime_time(entry['start_time']).strftime('%H:%M')
+        end_str = convert_db_time_to_datetime_time(entry['end_time']).strftime('%H:%M')
+        entry_col, button_col = st.columns([0.8, 0.2])
+        entry_col.write(f"{entry['booking_date']} {start_str} - {end_str}（{entry['purpose'] or '无备注'}）")
+        if button_col.button("取消候补", key=f"leave_waitlist_{entry['id']}"):
+            if leave_waitlist_db(entry['id'], user_id):
+                st.rerun()
+            else:
+                st.warning("该候补已转为预约或已不存在，请刷新页面。")
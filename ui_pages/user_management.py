@@ -2,7 +2,8 @@
 import streamlit as st
 import pandas as pd
 from database_utils import (
-    get_all_users_db, 
+    search_users_db,
+    get_user_profile_db,
     add_user_db, 
     delete_user_db, 
     update_user_role_db,
@@ -14,7 +15,25 @@ from auth_utils import hash_password
 def show_user_management_page(): # Admin only
     st.subheader("用户管理")
 
-    users = get_all_users_db()
+    # Server-side prefix search, one page at a time: page weight stays the same however
+    # many users exist, and only the selected user is loaded in full.
+    search_col, field_col = st.columns([0.7, 0.3])
+    with search_col:
+        search_prefix = st.text_input("搜索用户 (前缀匹配)", key="admin_user_search_prefix").strip()
+    with field_col:
+        search_by = st.radio(
+            "按", options=["student_id", "name"], horizontal=True,
+            format_func=lambda x: "学号" if x == "student_id" else "姓名",
+            key="admin_user_search_by"
+        )
+
+    # Page start keys for "previous"; reset whenever the search changes
+    if st.session_state.get("admin_user_search_key") != (search_prefix, search_by):
+        st.session_state.admin_user_search_key = (search_prefix, search_by)
+        st.session_state.admin_user_search_pages = [None]
+    page_starts = st.session_state.admin_user_search_pages
+    users, next_after = search_users_db(search_prefix, search_by, page_starts[-1])
+
     if users:
         df_users = pd.DataFrame(users)
         df_users_display = df_users.rename(columns={
@@ -23,7 +42,19 @@ def show_user_management_page(): # Admin only
         })
         st.dataframe(df_users_display[['ID', '学号', '姓名', '角色', '下次登录需改密']])
     else:
-        st.info("系统中没有用户。")
+        st.info("没有匹配的用户。" if search_prefix else "系统中没有用户。")
+
+    prev_col, page_col, next_col = st.columns([0.2, 0.6, 0.2])
+    with prev_col:
+        if st.button("上一页", disabled=len(page_starts) == 1, key="admin_user_search_prev"):
+            page_starts.pop()
+            st.rerun()
+    with page_col:
+        st.caption(f"第 {len(page_starts)} 页")
+    with next_col:
+        if st.button("下一页", disabled=next_after is None, key="admin_user_search_next"):
+            page_starts.append(next_after)
+            st.rerun()
 
     st.markdown("---")
     with st.expander("添加新用户"):
@@ -52,7 +83,7 @@ def show_user_management_page(): # Admin only
         st.markdown("---")
         st.subheader("管理现有用户")
         
-        user_options_dict_admin = {u['id']: f"{u['name']} ({u['student_id']})" for u in users}
+        user_options_dict_admin = {u['id']: f"{u['name']} ({u['student_id']})" for u in users} # Current page only
         options_list_admin = [""] + list(user_options_dict_admin.keys())
 
         selected_user_id_admin = st.selectbox(
@@ -63,7 +94,7 @@ def show_user_management_page(): # Admin only
         )
 
         if selected_user_id_admin:
-            selected_user = next((u for u in users if u['id'] == selected_user_id_admin), None)
+            selected_user = get_user_profile_db(selected_user_id_admin)
 
             if selected_user:
                 st.write(f"正在管理用户: **{selected_user['name']} ({selected_user['student_id']})**")